@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+'''
+measure the start-up time of the hfquickplot command line tool. Heavy dependencies (ROOT, numpy, ...)
+are imported lazily, so commands that do not need them should start well below a second.
+
+    python benchmarks/import_time.py [-n repetitions]
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import argparse
+
+HEAVY = ['ROOT','numpy','brewer2mpl']
+
+TOPLEVEL_XML = '''<!DOCTYPE Combination SYSTEM 'HistFactorySchema.dtd'>
+<Combination OutputFilePrefix="./results/example">
+  <Input>{channel}</Input>
+  <Measurement Name="meas" Lumi="1.0" LumiRelErr="0.1">
+    <POI>SigXsecOverSM</POI>
+  </Measurement>
+</Combination>
+'''
+
+CHANNEL_XML = '''<!DOCTYPE Channel SYSTEM 'HistFactorySchema.dtd'>
+<Channel Name="channel1" InputFile="data.root">
+  <Data HistoName="data" />
+  <Sample Name="signal" HistoName="signal">
+    <OverallSys Name="syst1" High="1.05" Low="0.95"/>
+    <NormFactor Name="SigXsecOverSM" Val="1" Low="0." High="3."/>
+  </Sample>
+  <Sample Name="background" HistoName="background">
+    <HistoSys Name="syst2" HistoNameHigh="background_up" HistoNameLow="background_down"/>
+  </Sample>
+</Channel>
+'''
+
+RUN_COMMAND = '''import sys
+from hftools.plotting.quickplot_cli import toplevel
+command = [c for c in toplevel.commands if c.replace('-','_') == {command!r}][0] if {command!r} else None
+args = ([command] if command else []) + {args!r}
+try:
+    toplevel.main(args = args, standalone_mode = False)
+except SystemExit:
+    pass
+sys.stderr.write(','.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+def cases(workdir):
+    toplevel,channel = os.path.join(workdir,'toplevel.xml'),os.path.join(workdir,'channel1.xml')
+    with open(channel,'w') as f:
+        f.write(CHANNEL_XML)
+    with open(toplevel,'w') as f:
+        f.write(TOPLEVEL_XML.format(channel = channel))
+    return [
+        ('import hftools.plotting.quickplot_cli',None,[]),
+        ('hfquickplot --help',None,['--help']),
+        ('hfquickplot dump_information','dump_information',[toplevel,os.path.join(workdir,'dump.yml')]),
+    ]
+
+def run(command,args):
+    statement = RUN_COMMAND.format(command = command,args = args,heavy = HEAVY)
+    start = time.time()
+    proc = subprocess.Popen([sys.executable,'-c',statement],stdout = subprocess.PIPE,stderr = subprocess.PIPE)
+    _,err = proc.communicate()
+    elapsed = time.time()-start
+    if proc.returncode:
+        raise RuntimeError(err.decode())
+    return elapsed,err.decode().strip().splitlines()[-1:] or ['']
+
+def main():
+    parser = argparse.ArgumentParser(description = 'start-up time benchmark for hfquickplot')
+    parser.add_argument('-n','--repetitions',type = int,default = 5)
+    options = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        print('{:<35} {:>8} {:>8}  {}'.format('case','min [s]','avg [s]','heavy modules loaded'))
+        for label,command,args in cases(workdir):
+            results = [run(command,args) for _ in range(options.repetitions)]
+            timings = [t for t,_ in results]
+            loaded = results[-1][1][0]
+            print('{:<35} {:>8.3f} {:>8.3f}  {}'.format(label,min(timings),sum(timings)/len(timings),loaded or '-'))
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
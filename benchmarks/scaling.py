@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+'''
+time the hot paths of hftools (extract, extract_data, hepdata_table, convertROOT, quickplot, fit)
+on a grid of synthetic workspaces and record the results as JSON. Comparing against an earlier
+result file reports the slowdown per case, e.g. to catch scaling regressions.
+
+    python benchmarks/scaling.py --channels 1,8 --samples 2,10 --bins 10,100 -o results.json
+    python benchmarks/scaling.py ... --compare baseline.json --max-slowdown 1.5
+
+Needs ROOT (with hist2workspace), the benchmark is skipped otherwise.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import itertools
+import subprocess
+
+from synthetic import Config, make_workspace, shapesys_name, SHAPESYS_CONSTRAINT
+
+CASES = ['extract','extract_data','hepdata_table','convertROOT','quickplot','fit']
+
+def _systematics(config,channel,sample):
+    systs = {}
+    for j in range(config.overallsys):
+        systs['os{}'.format(j)] = {'HFname':'os{}_{}'.format(sample,j),'HFtype':'OverallSys'}
+    for j in range(config.histosys):
+        systs['hs{}'.format(j)] = {'HFname':'hs{}_{}'.format(sample,j),'HFtype':'HistoSys'}
+    for j in range(config.shapesys):
+        systs['ss{}'.format(j)] = {'HFname':shapesys_name(channel,sample,j),'HFtype':'ShapeSys',
+                                   'additional_args':{'constraint_type':SHAPESYS_CONSTRAINT}}
+    systs['lumi'] = {'HFname':'Lumi','HFtype':'Lumi'}
+    return systs
+
+def benchmarks(ws,config,workdir):
+    '''
+    :return: dictionary of case name to a callable running one round of that case
+    '''
+    import hftools.utils as hfutils
+    import hftools.hepdata as hfhepdata
+    import hftools.hepdata.rootcnv as hfrootcnv
+    import hftools.plotting as hfplot
+    import hftools.fitting as hffit
+
+    channels = config.channel_names()
+    samples = config.sample_names()
+
+    def extract():
+        hfutils.invalidate_cache()
+        for channel in channels:
+            for sample in samples:
+                hfutils.extract(ws,channel,'x',sample)
+
+    def extract_data():
+        hfutils.invalidate_cache()
+        for channel in channels:
+            hfutils.extract_data(ws,channel,'x')
+
+    def hepdata_table():
+        sampledef = [(sample,{'systs':_systematics(config,channels[0],sample)}) for sample in samples]
+        hfhepdata.hepdata_table(ws,channels[0],'x',sampledef)
+
+    inputs = [(sample,hfutils.extract(ws,channels[0],'x',sample)) for sample in samples]
+
+    def convertROOT():
+        # convertROOT consumes the conversion definitions, so every round gets a new table
+        table = {
+            'name': 'benchmark',
+            'independent_variables': [{'header': {'name': 'x'}}],
+            'dependent_variables': [{
+                'header': {'name': sample},
+                'conversion': {
+                    'formatter': hfrootcnv.formatters.standard_format,
+                    'formatter_args': {},
+                    'inputs': {'histo': histo}
+                }} for sample,histo in inputs]
+        }
+        hfrootcnv.convertROOT(table)
+
+    def quickplot():
+        for channel in channels:
+            hfplot.quickplot(ws,channel,'x',samples,os.path.join(workdir,'{}.png'.format(channel)),
+                             None,None,None,False,'600x600',False)
+
+    def fit():
+        ws.loadSnapshot('NominalParamValues')
+        hffit.fit(ws)
+
+    return {
+        'extract': extract, 'extract_data': extract_data, 'hepdata_table': hepdata_table,
+        'convertROOT': convertROOT, 'quickplot': quickplot, 'fit': fit
+    }
+
+def timeit(func,rounds):
+    '''
+    run a function a number of times, after one warm-up round
+
+    :return: dictionary with the minimum, mean and standard deviation of the timings in seconds
+    '''
+    func()
+    timings = []
+    for _ in range(rounds):
+        start = time.time()
+        func()
+        timings += [time.time()-start]
+    mean = sum(timings)/len(timings)
+    stddev = (sum((t-mean)**2 for t in timings)/len(timings))**0.5
+    return {'rounds': rounds, 'min': min(timings), 'mean': mean, 'stddev': stddev}
+
+def run_grid(grid,cases,rounds,workdir):
+    import ROOT
+    ROOT.gROOT.SetBatch(True)
+    results = []
+    for values in itertools.product(*grid.values()):
+        config = Config(**dict(zip(grid.keys(),values)))
+        configdir = os.path.join(workdir,config.label())
+        os.makedirs(configdir)
+        rootfile,workspace = make_workspace(config,configdir)
+        f = ROOT.TFile.Open(rootfile)
+        ws = f.Get(workspace)
+        funcs = benchmarks(ws,config,configdir)
+        for case in cases:
+            timing = timeit(funcs[case],rounds)
+            results += [dict(timing,case = case,config = config.as_dict(),label = config.label())]
+            print('{:<15} {:<40} {:>10.4f} {:>10.4f}'.format(case,config.label(),timing['min'],timing['mean']))
+        f.Close()
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'],cwd = os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def compare(results,baseline,max_slowdown):
+    '''
+    print the slowdown of each case with respect to a baseline result file
+
+    :return: list of (case, label, slowdown) above max_slowdown
+    '''
+    reference = {(r['case'],r['label']):r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        ref = reference.get((r['case'],r['label']))
+        if not ref or not ref['min']:
+            continue
+        slowdown = r['min']/ref['min']
+        print('{:<15} {:<40} {:>8.2f}x'.format(r['case'],r['label'],slowdown))
+        if slowdown > max_slowdown:
+            regressions += [(r['case'],r['label'],slowdown)]
+    return regressions
+
+def _intlist(value):
+    return [int(v) for v in value.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description = 'scaling benchmark of hftools on synthetic workspaces')
+    defaults = Config()
+    for name in ['channels','samples','bins','overallsys','histosys','shapesys','events']:
+        parser.add_argument('--{}'.format(name),type = _intlist,default = [getattr(defaults,name)],
+                            help = 'comma separated list of values')
+    parser.add_argument('--cases',default = ','.join(CASES),help = 'comma separated list of cases')
+    parser.add_argument('-n','--rounds',type = int,default = 3)
+    parser.add_argument('-o','--output',default = 'benchmark_results.json')
+    parser.add_argument('--compare',default = None,help = 'earlier result file to compare to')
+    parser.add_argument('--max-slowdown',type = float,default = 1.5)
+    parser.add_argument('--keep',action = 'store_true',help = 'keep the generated workspaces')
+    options = parser.parse_args()
+
+    cases = options.cases.split(',')
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: {}'.format(', '.join(sorted(unknown))))
+
+    try:
+        __import__('ROOT')
+    except ImportError:
+        print('ROOT is not available, skipping the benchmark')
+        return
+
+    grid = dict((name,getattr(options,name)) for name in ['channels','samples','bins','overallsys','histosys','shapesys','events'])
+
+    workdir = tempfile.mkdtemp()
+    try:
+        results = run_grid(grid,cases,options.rounds,workdir)
+    finally:
+        if options.keep:
+            print('workspaces kept in {}'.format(workdir))
+        else:
+            shutil.rmtree(workdir)
+
+    import ROOT
+    document = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'root': ROOT.gROOT.GetVersion(),
+        'host': platform.node(),
+        'results': results,
+    }
+    with open(options.output,'w') as f:
+        json.dump(document,f,indent = 2,sort_keys = True)
+    print('wrote {}'.format(options.output))
+
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results,json.load(f),options.max_slowdown)
+        if regressions:
+            sys.exit('{} cases slower than {}x the baseline'.format(len(regressions),options.max_slowdown))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+'''
+generate synthetic HistFactory workspaces of configurable size. Histograms and XML are written
+to a work directory and turned into a workspace with hist2workspace, no input files are needed.
+
+    python benchmarks/synthetic.py workdir [--channels 4] [--samples 5] [--bins 20] ...
+'''
+import os
+import sys
+import shutil
+import argparse
+import subprocess
+
+TOPLEVEL_XML = '''{doctype}<Combination OutputFilePrefix="{prefix}">
+{inputs}
+  <Measurement Name="meas" Lumi="1.0" LumiRelErr="0.02" ExportOnly="True">
+    <POI>mu</POI>
+  </Measurement>
+</Combination>
+'''
+
+CHANNEL_XML = '''{doctype}<Channel Name="{channel}" InputFile="{inputfile}">
+  <Data HistoName="{channel}_data" />
+{samples}
+</Channel>
+'''
+
+SAMPLE_XML = '''  <Sample Name="{sample}" HistoName="{channel}_{sample}" NormalizeByTheory="True">
+{systematics}
+  </Sample>'''
+
+DOCTYPE = "<!DOCTYPE {} SYSTEM 'HistFactorySchema.dtd'>\n"
+
+SHAPESYS_CONSTRAINT = 'Poisson'
+
+class Config(object):
+    '''
+    size of a synthetic workspace
+
+    :param channels: number of channels
+    :param samples: number of samples per channel, the first one is the signal scaled by the POI mu
+    :param bins: number of bins per channel
+    :param overallsys: number of OverallSys per sample
+    :param histosys: number of HistoSys per sample
+    :param shapesys: number of (Poisson constrained) ShapeSys per sample
+    :param events: expected number of events per channel
+    :param seed: random seed for the shapes and the data
+    '''
+    def __init__(self,channels = 2,samples = 3,bins = 10,overallsys = 1,histosys = 1,shapesys = 1,events = 1000,seed = 1234):
+        self.channels = channels
+        self.samples = samples
+        self.bins = bins
+        self.overallsys = overallsys
+        self.histosys = histosys
+        self.shapesys = shapesys
+        self.events = events
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def channel_names(self):
+        return ['ch{}'.format(i) for i in range(self.channels)]
+
+    def sample_names(self):
+        return ['signal'] + ['bkg{}'.format(i) for i in range(1,self.samples)]
+
+    def label(self):
+        return 'c{channels}_s{samples}_b{bins}_os{overallsys}_hs{histosys}_ss{shapesys}_e{events}'.format(**self.__dict__)
+
+def shapesys_name(channel,sample,index):
+    return 'ss{}_{}_{}'.format(channel,sample,index)
+
+def _histogram(ROOT,name,contents):
+    h = ROOT.TH1F(name,name,len(contents),0.,float(len(contents)))
+    h.SetDirectory(0)
+    for i,value in enumerate(contents):
+        h.SetBinContent(i+1,value)
+    return h
+
+def _sample_xml(config,channel,sample):
+    systs = []
+    if sample == 'signal':
+        systs += ['    <NormFactor Name="mu" Val="1" Low="0." High="5."/>']
+    for j in range(config.overallsys):
+        systs += ['    <OverallSys Name="os{}_{}" High="1.05" Low="0.95"/>'.format(sample,j)]
+    for j in range(config.histosys):
+        systs += ['    <HistoSys Name="hs{}_{}" HistoNameHigh="{}_{}_hs{}_up" HistoNameLow="{}_{}_hs{}_down"/>'.format(
+            sample,j,channel,sample,j,channel,sample,j)]
+    for j in range(config.shapesys):
+        systs += ['    <ShapeSys Name="{}" HistoName="{}_{}_ss{}" ConstraintType="{}"/>'.format(
+            shapesys_name(channel,sample,j),channel,sample,j,SHAPESYS_CONSTRAINT)]
+    return SAMPLE_XML.format(sample = sample,channel = channel,systematics = '\n'.join(systs))
+
+def write_inputs(config,workdir):
+    '''
+    write the input histograms and the XML configuration of a synthetic workspace
+
+    :param config: a Config object
+    :param workdir: directory to write to
+    :return: path of the top-level XML file
+    '''
+    import ROOT
+    import numpy as np
+    rng = np.random.RandomState(config.seed)
+
+    doctype = ''
+    dtd = os.path.join(str(ROOT.gROOT.GetEtcDir()),'HistFactorySchema.dtd')
+    if os.path.exists(dtd):
+        shutil.copy(dtd,workdir)
+        doctype = DOCTYPE
+
+    inputfile = os.path.join(workdir,'inputs.root')
+    f = ROOT.TFile.Open(inputfile,'RECREATE')
+    channelfiles = []
+    x = (np.arange(config.bins)+0.5)/config.bins
+    for channel in config.channel_names():
+        shapes = [np.exp(-0.5*((x-0.5)/0.1)**2)]
+        shapes += [np.exp(-x*rng.uniform(0.5,3.0)) + 0.1 for _ in config.sample_names()[1:]]
+        shapes = [shape/shape.sum()*norm for shape,norm in zip(shapes,rng.uniform(0.5,1.5,len(shapes)))]
+        scale = config.events/sum(shape.sum() for shape in shapes)
+
+        expected = np.zeros(config.bins)
+        histos = []
+        for sample,shape in zip(config.sample_names(),shapes):
+            nominal = shape*scale
+            expected += nominal
+            histos += [_histogram(ROOT,'{}_{}'.format(channel,sample),nominal)]
+            for j in range(config.histosys):
+                tilt = 1 + rng.uniform(0.02,0.1)*(x-0.5)
+                histos += [_histogram(ROOT,'{}_{}_hs{}_up'.format(channel,sample,j),nominal*tilt)]
+                histos += [_histogram(ROOT,'{}_{}_hs{}_down'.format(channel,sample,j),nominal/tilt)]
+            for j in range(config.shapesys):
+                histos += [_histogram(ROOT,'{}_{}_ss{}'.format(channel,sample,j),rng.uniform(0.01,0.1,config.bins))]
+        histos += [_histogram(ROOT,'{}_data'.format(channel),rng.poisson(expected).astype(float))]
+
+        f.cd()
+        for h in histos:
+            h.Write()
+
+        samples = '\n'.join(_sample_xml(config,channel,sample) for sample in config.sample_names())
+        channelfile = os.path.join(workdir,'{}.xml'.format(channel))
+        with open(channelfile,'w') as cf:
+            cf.write(CHANNEL_XML.format(doctype = doctype.format('Channel'),channel = channel,inputfile = inputfile,samples = samples))
+        channelfiles += [channelfile]
+    f.Close()
+
+    toplevel = os.path.join(workdir,'toplevel.xml')
+    with open(toplevel,'w') as tf:
+        tf.write(TOPLEVEL_XML.format(doctype = doctype.format('Combination'),prefix = os.path.join(workdir,'results','synthetic'),
+                                     inputs = '\n'.join('  <Input>{}</Input>'.format(c) for c in channelfiles)))
+    return toplevel
+
+def make_workspace(config,workdir):
+    '''
+    build a synthetic workspace
+
+    :param config: a Config object
+    :param workdir: directory to write the inputs and the workspace to
+    :return: tuple of the workspace ROOT file name and the workspace name
+    '''
+    if not os.path.exists(os.path.join(workdir,'results')):
+        os.makedirs(os.path.join(workdir,'results'))
+    toplevel = write_inputs(config,workdir)
+    with open(os.path.join(workdir,'hist2workspace.log'),'w') as log:
+        subprocess.check_call(['hist2workspace',toplevel],cwd = workdir,stdout = log,stderr = subprocess.STDOUT)
+    return os.path.join(workdir,'results','synthetic_combined_meas_model.root'),'combined'
+
+def main():
+    parser = argparse.ArgumentParser(description = 'generate a synthetic HistFactory workspace')
+    parser.add_argument('workdir')
+    defaults = Config()
+    for name,value in sorted(defaults.as_dict().items()):
+        parser.add_argument('--{}'.format(name),type = int,default = value)
+    options = vars(parser.parse_args())
+    workdir = options.pop('workdir')
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    try:
+        __import__('ROOT')
+    except ImportError:
+        sys.exit('ROOT is needed to generate workspaces')
+    rootfile,workspace = make_workspace(Config(**options),workdir)
+    print('{} {}'.format(rootfile,workspace))
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,309 @@
-import ROOT
+import time
 import hftools.utils as hfutils
+from ..lazy import lazy_import
+ROOT = lazy_import('ROOT')
+np = lazy_import('numpy')
 
-def fit(workspace):
+import logging
+log = logging.getLogger(__name__)
+
+class FitOptions(object):
     '''
-	fit the model to the data.
+    configuration of a fit of the model to the data
 
-	:param workspace: the workspace object
-	:return: fit result object
-	'''
-    result = workspace.pdf(hfutils.simulPdfName()).fitTo(workspace.data(hfutils.dataName()),
+    :param cpus: number of processes used to evaluate the likelihood in parallel
+    :param optimize_const: constant term optimization level (0: off, 1: cache constant terms, 2: also cache constant branches)
+    :param minimizer: minimizer type (e.g. Minuit2 or Minuit)
+    :param algorithm: minimization algorithm (e.g. Migrad)
+    :param strategy: minimizer strategy (0-2)
+    :param tolerance: minimizer tolerance (None for the minimizer default)
+    :param hesse: run Hesse after the minimization
+    :param minos: list of parameter names to run Minos on
+    :param offset: offset the likelihood for better numerical precision
+    :param print_level: minimizer print level
+    '''
+    def __init__(self,cpus = 1,optimize_const = 2,minimizer = 'Minuit2',algorithm = 'Migrad',strategy = 1,
+                 tolerance = None,hesse = True,minos = None,offset = True,print_level = -1):
+        self.cpus = cpus
+        self.optimize_const = optimize_const
+        self.minimizer = minimizer
+        self.algorithm = algorithm
+        self.strategy = strategy
+        self.tolerance = tolerance
+        self.hesse = hesse
+        self.minos = minos or []
+        self.offset = offset
+        self.print_level = print_level
+
+class FitResult(object):
+    '''
+    result of a fit
+
+    :ivar roofit: the RooFitResult object
+    :ivar stages: list of dictionaries with name, status, number of calls and wall time of each fit stage
+    :ivar nll: the (non-offset) value of the negative log-likelihood at the minimum
+    '''
+    def __init__(self,roofit,stages,nll):
+        self.roofit = roofit
+        self.stages = stages
+        self.nll = nll
+
+    @property
+    def status(self):
+        return self.roofit.status()
+
+    @property
+    def edm(self):
+        return self.roofit.edm()
+
+    @property
+    def ncalls(self):
+        return sum(stage['ncalls'] for stage in self.stages)
+
+    def stage_calls(self,name):
+        '''
+        :param name: name of a fit stage (e.g. the minimization algorithm in lower case)
+        :return: number of NLL evaluations of that stage
+        '''
+        return sum(stage['ncalls'] for stage in self.stages if stage['stage'] == name)
+
+    @property
+    def walltime(self):
+        return sum(stage['seconds'] for stage in self.stages)
+
+    def summary(self):
+        '''
+        :return: YAML/JSON serializable summary of the fit
+        '''
+        return {
+            'status': int(self.status),
+            'covqual': int(self.roofit.covQual()),
+            'edm': float(self.edm),
+            'nll': float(self.nll),
+            'ncalls': int(self.ncalls),
+            'seconds': float(self.walltime),
+            'stages': [dict(stage) for stage in self.stages]
+        }
+
+def create_nll(workspace,options = None,data = None):
+    '''
+    create the negative log-likelihood of the model
+
+    :param workspace: the workspace object
+    :param options: FitOptions (only the likelihood related settings are used)
+    :param data: dataset to use instead of the observed data
+    :return: the NLL object
+    '''
+    options = options or FitOptions()
+    data = data if data is not None else workspace.data(hfutils.dataName())
+    return workspace.pdf(hfutils.simulPdfName()).createNLL(data,
         ROOT.RooFit.Extended(True),
-        ROOT.RooFit.Save(True),
-        ROOT.RooFit.Minimizer("Minuit","Migrad"),
-        ROOT.RooFit.Offset(True)
+        ROOT.RooFit.Offset(options.offset),
+        ROOT.RooFit.NumCPU(options.cpus)
     )
+
+def nll_value(nll,absolute_nll = None):
+    '''
+    the value of the NLL without offset. Toggling the offsetting of an NLL resets its offset, so for
+    an offset NLL a separate NLL without offsetting (of the same model and data) is evaluated.
+
+    :param nll: a NLL object
+    :param absolute_nll: NLL object without offsetting, needed if nll is offset
+    :return: the current value of the NLL without offset
+    '''
+    if not nll.isOffsetting():
+        return nll.getVal()
+    if absolute_nll is None:
+        raise ValueError('the absolute value of an offset NLL needs a NLL without offsetting')
+    return absolute_nll.getVal()
+
+def _run_stage(minimizer,name,action):
+    calls = minimizer.evalCounter()
+    start = time.time()
+    status = action()
+    return {
+        'stage':name,
+        'status':int(status),
+        'ncalls':int(minimizer.evalCounter()-calls),
+        'seconds':time.time()-start
+    }
+
+def seed_parameters(workspace,parpoint_data,use_errors = True):
+    '''
+    set parameter values, and the initial step sizes from their errors, from a parameter
+    point in the format written by save_pars (values only or with errors)
+
+    :param workspace: the workspace object
+    :param parpoint_data: dictionary of parameter name to value or to {'val':..,'err':..}
+    :param use_errors: use the errors as initial step sizes of the minimizer
+    :return: list of the names of the seeded parameters
+    '''
+    seeded = []
+    for name,value_data in parpoint_data.iteritems():
+        var = workspace.var(name)
+        if not var:
+            log.warning('parameter %s not in workspace, not seeding it',name)
+            continue
+        if isinstance(value_data,dict):
+            val,err = value_data['val'],value_data.get('err')
+        else:
+            val,err = value_data,None
+        var.setVal(val)
+        if use_errors and err and err > 0 and not var.isConstant():
+            var.setError(err)
+        seeded += [name]
+    return seeded
+
+def _apply_covariance(minimizer,nll,fitresult):
+    floating = [p.GetName() for p in hfutils.iterate(fitresult.floatParsFinal())]
+    parameters = nll.getParameters(ROOT.RooArgSet())
+    current = [p.GetName() for p in hfutils.iterate(parameters) if not p.isConstant()]
+    if sorted(floating) != sorted(current):
+        log.warning('floating parameters differ from the ones of the initial fit result, not using its covariance')
+        return False
+    minimizer.applyCovarianceMatrix(fitresult.covarianceMatrix())
+    return True
+
+def float_parameters(fitresult):
+    '''
+    :param fitresult: a RooFitResult
+    :return: dictionary of the fitted values of the floating parameters
+    '''
+    return {p.GetName():float(p.getVal()) for p in hfutils.iterate(fitresult.floatParsFinal())}
+
+def minimize(workspace,nll,options = None,initial_fitresult = None,absolute_nll = None):
+    '''
+    minimize a NLL object
+
+    :param workspace: the workspace object
+    :param nll: the NLL object
+    :param options: FitOptions
+    :param initial_fitresult: RooFitResult whose covariance is used to seed the minimizer step sizes
+    :param absolute_nll: NLL object without offsetting to evaluate the minimum with, if nll is offset
+    :return: FitResult
+    '''
+    options = options or FitOptions()
+    minimizer = ROOT.RooMinimizer(nll)
+    minimizer.setMinimizerType(options.minimizer)
+    minimizer.setStrategy(options.strategy)
+    minimizer.setPrintLevel(options.print_level)
+    if options.tolerance is not None:
+        minimizer.setEps(options.tolerance)
+    minimizer.optimizeConst(options.optimize_const)
+    if initial_fitresult:
+        _apply_covariance(minimizer,nll,initial_fitresult)
+
+    stages = [_run_stage(minimizer,options.algorithm.lower(),lambda: minimizer.minimize(options.minimizer,options.algorithm))]
+    if options.hesse:
+        stages += [_run_stage(minimizer,'hesse',minimizer.hesse)]
+    if options.minos:
+        minos_pars = ROOT.RooArgSet()
+        for name in options.minos:
+            minos_pars.add(workspace.var(name))
+        stages += [_run_stage(minimizer,'minos',lambda: minimizer.minos(minos_pars))]
+
+    result = minimizer.save()
     assert result
-    return result
\ No newline at end of file
+    return FitResult(result,stages,nll_value(nll,absolute_nll))
+
+class Likelihood(object):
+    '''
+    long-lived negative log-likelihood of the model for repeated evaluations. The NLL is created
+    once and its caches (constant term optimization, offsets) are kept across evaluations. With
+    offsetting enabled (the default of FitOptions) the values are shifted by a constant fixed at the
+    first evaluation, so only differences are meaningful; use FitOptions(offset = False) or absolute_nll()
+    for absolute values.
+
+    :param workspace: the workspace object
+    :param options: FitOptions (likelihood and minimizer settings)
+    :param data: dataset to use instead of the observed data
+    '''
+    def __init__(self,workspace,options = None,data = None):
+        self.workspace = workspace
+        self.options = options or FitOptions()
+        self.data = data
+        self.nll = create_nll(workspace,self.options,data)
+        self._absolute_nll = None
+        self.variables = {p.GetName():p for p in hfutils.iterate(self.nll.getParameters(ROOT.RooArgSet()))}
+        self.parameters = sorted(name for name,p in self.variables.iteritems() if not p.isConstant())
+        self._optimized = False
+
+    def set(self,point,current = None):
+        '''
+        set parameter values, changing only those that differ from the current ones
+
+        :param point: {name: value} dictionary
+        :param current: dictionary of the current values (updated in place)
+        '''
+        for name,value in point.iteritems():
+            if current is None or current.get(name) != value:
+                self.variables[name].setVal(value)
+                if current is not None:
+                    current[name] = value
+
+    def value(self):
+        return self.nll.getVal()
+
+    def evaluate(self,points,parameters = None):
+        '''
+        evaluate the NLL for many parameter points. Only the parameters that change from one point
+        to the next are set.
+
+        :param points: list of {name: value} dictionaries or a 2D array with one row per point
+        :param parameters: parameter names of the array columns (defaults to all floating parameters)
+        :return: numpy array of NLL values
+        '''
+        if not self._optimized and self.options.optimize_const:
+            self.nll.constOptimizeTestStatistic(ROOT.RooAbsArg.Activate,self.options.optimize_const > 1)
+            self._optimized = True
+
+        if not isinstance(points,(list,tuple)):
+            parameters = parameters or self.parameters
+            points = (dict(zip(parameters,row)) for row in np.asarray(points,dtype = float).tolist())
+        else:
+            parameters = set(name for point in points for name in point)
+
+        current = {name:self.variables[name].getVal() for name in parameters}
+        values = []
+        for point in points:
+            self.set(point,current)
+            values += [self.nll.getVal()]
+        return np.array(values,dtype = float)
+
+    def minimize(self,options = None,initial_fitresult = None):
+        '''
+        minimize the NLL
+
+        :param options: FitOptions (defaults to the options of the likelihood)
+        :param initial_fitresult: RooFitResult used to seed the step sizes
+        :return: FitResult
+        '''
+        absolute_nll = self.absolute_nll() if self.nll.isOffsetting() else None
+        return minimize(self.workspace,self.nll,options or self.options,initial_fitresult,absolute_nll)
+
+    def absolute_nll(self):
+        '''
+        :return: NLL of the same model and data without offsetting, created on first use. The offset
+                 of the main NLL stays untouched.
+        '''
+        if self._absolute_nll is None:
+            self._absolute_nll = create_nll(self.workspace,FitOptions(offset = False),self.data)
+        return self._absolute_nll
+
+def fit(workspace,options = None,data = None,initial_fitresult = None):
+    '''
+	fit the model to the data.
+
+	:param workspace: the workspace object
+	:param options: FitOptions object (defaults to a single-core Migrad+Hesse fit)
+	:param data: dataset to fit instead of the observed data
+	:param initial_fitresult: RooFitResult of a previous fit used to seed the step sizes (warm start)
+	:return: FitResult object
+	'''
+    options = options or FitOptions()
+    start = time.time()
+    likelihood = Likelihood(workspace,options,data)
+    setup = {'stage':'setup','status':0,'ncalls':0,'seconds':time.time()-start}
+    result = likelihood.minimize(options,initial_fitresult)
+    result.stages.insert(0,setup)
+    return result
@@ -0,0 +1,132 @@
+import copy
+import yaml
+import hftools.utils as hfutils
+from . import workers
+from . import FitOptions, fit, float_parameters
+
+import logging
+log = logging.getLogger(__name__)
+
+def nuisance_parameters(ws):
+    '''
+    :param ws: a workspace object
+    :return: names of the floating nuisance parameters of the ModelConfig
+    '''
+    nuis = ws.obj('ModelConfig').GetNuisanceParameters()
+    if not nuis:
+        return []
+    return [v.GetName() for v in hfutils.iterate(nuis) if not v.isConstant()]
+
+def poi_name(ws):
+    return ws.obj('ModelConfig').GetParametersOfInterest().first().GetName()
+
+def _refit_options(options):
+    refit = copy.copy(options)
+    refit.hesse = False
+    refit.minos = []
+    return refit
+
+def _impact(ws,task):
+    parameter,poi,hat,err,options = task
+    var = ws.var(parameter)
+    record = {'parameter':parameter,'val':hat,'err':err}
+    for tag,shifted in [('up',hat+err),('down',hat-err)]:
+        try:
+            # every refit starts from the unconditional fit
+            workers.restore()
+            var.setVal(min(max(shifted,var.getMin()),var.getMax()))
+            var.setConstant(True)
+            try:
+                result = fit(ws,options)
+            finally:
+                var.setConstant(False)
+        except Exception as e:
+            workers.emit({'parameter':parameter,'error':str(e)})
+            return
+        record['poi_{}'.format(tag)] = ws.var(poi).getVal()
+        record['status_{}'.format(tag)] = int(result.status)
+    workers.emit(record)
+
+def unconditional_fit(rootfile,workspace,options):
+    '''
+    :return: dictionary with the POI name, the NLL and the fitted values and errors of all floating parameters
+    '''
+    f,ws = workers.load_workspace(rootfile,workspace)
+    result = fit(ws,options)
+    values = float_parameters(result.roofit)
+    pars = {name:{'val':val,'err':float(ws.var(name).getError())} for name,val in values.iteritems()}
+    return {'unconditional':{'poi':poi_name(ws),'nll':float(result.nll),'status':int(result.status),'pars':pars},
+            'nuisances':[n for n in nuisance_parameters(ws) if n in pars]}
+
+def impacts(rootfile,workspace,checkpoint,jobs = 1,options = None,parameters = None,on_parameter = None):
+    '''
+    impact of the nuisance parameters on the parameter of interest: after an unconditional fit,
+    each nuisance parameter is fixed to its fitted value +/- its error and the model is refit,
+    starting from the unconditional fit. The refits are distributed over worker processes and every
+    finished parameter is appended to the checkpoint file, from which an interrupted run resumes.
+
+    :param rootfile: path to the ROOT file
+    :param workspace: name of the workspace
+    :param checkpoint: checkpoint file (YAML documents)
+    :param jobs: number of worker processes
+    :param options: FitOptions for the fits (Hesse and Minos are only run for the unconditional fit)
+    :param parameters: names of the nuisance parameters to consider (default: all floating ones)
+    :param on_parameter: optional callback for every finished parameter record
+    :return: dictionary of parameter name to impact record, in the save_pars style
+    :raises ValueError: if one of the given parameters is not a floating parameter
+    '''
+    options = options or FitOptions()
+    records = workers.read_records(checkpoint)
+    nominal = [r for r in records if 'unconditional' in r]
+    if nominal:
+        nominal = nominal[0]
+    else:
+        nominal = unconditional_fit(rootfile,workspace,options)
+        workers.append_record(checkpoint,nominal)
+
+    unconditional = nominal['unconditional']
+    poi = unconditional['poi']
+    done = {r['parameter'] for r in records if 'parameter' in r and 'error' not in r}
+    unknown = [n for n in (parameters or []) if n not in unconditional['pars']]
+    if unknown:
+        raise ValueError('not floating parameters of the fit: {}'.format(', '.join(unknown)))
+    todo = [n for n in (parameters or nominal['nuisances']) if n not in done]
+    if done:
+        log.info('resuming impacts: %s parameters already done',len(done))
+
+    refit = _refit_options(options)
+    tasks = [(n,poi,unconditional['pars'][n]['val'],unconditional['pars'][n]['err'],refit) for n in todo]
+
+    def on_record(record):
+        workers.append_record(checkpoint,record)
+        if on_parameter:
+            on_parameter(record)
+
+    workers.run_pool(rootfile,workspace,_impact,tasks,jobs,on_record,parpoint = unconditional['pars'])
+    return ranking(workers.read_records(checkpoint))
+
+def ranking(records):
+    '''
+    :param records: records of a checkpoint file
+    :return: dictionary of parameter name to {'val','err','impact_up','impact_down','rank'}
+    '''
+    nominal = [r for r in records if 'unconditional' in r][0]['unconditional']
+    poi_hat = nominal['pars'][nominal['poi']]['val']
+    impacts = {}
+    for r in records:
+        if 'parameter' not in r or 'error' in r:
+            continue
+        impacts[r['parameter']] = {
+            'val': r['val'],
+            'err': r['err'],
+            'impact_up': r['poi_up'] - poi_hat,
+            'impact_down': r['poi_down'] - poi_hat,
+        }
+    ranked = sorted(impacts,key = lambda n: -max(abs(impacts[n]['impact_up']),abs(impacts[n]['impact_down'])))
+    for rank,name in enumerate(ranked):
+        impacts[name]['rank'] = rank + 1
+    return impacts
+
+def save_impacts(impacts,output):
+    with open(output,'w') as results:
+        results.write(yaml.dump(impacts,default_flow_style = False))
@@ -0,0 +1,73 @@
+import time
+from . import workers
+from . import FitOptions, fit, float_parameters
+
+import logging
+log = logging.getLogger(__name__)
+
+def _scan_chunk(ws,task):
+    parameter,values,options = task
+    var = ws.var(parameter)
+    var.setConstant(True)
+    for value in values:
+        # the workspace keeps the fitted values of the previous (neighbouring) point as starting values
+        start = time.time()
+        var.setVal(value)
+        try:
+            result = fit(ws,options)
+        except Exception as e:
+            workers.emit({'parameter':parameter,'value':value,'error':str(e)})
+            continue
+        workers.emit({
+            'parameter': parameter,
+            'value': value,
+            'nll': float(result.nll),
+            'status': int(result.status),
+            'edm': float(result.edm),
+            'ncalls': int(result.ncalls),
+            'seconds': time.time()-start,
+            'nuisances': float_parameters(result.roofit),
+        })
+
+def _key(value):
+    return round(float(value),10)
+
+def completed_points(output):
+    '''
+    :param output: scan output file
+    :return: dictionary of scan value to record of the successfully completed points
+    '''
+    return {_key(r['value']):r for r in workers.read_records(output) if 'value' in r and 'error' not in r}
+
+def scan(rootfile,workspace,parameter,values,output,jobs = 1,options = None,on_point = None):
+    '''
+    profile likelihood scan of a parameter. Conditional fits are run in contiguous chunks of the grid,
+    one chunk per worker process, and every point starts from the fit of its neighbour. Every point is
+    appended to the output file as soon as it is done, points already in the output are skipped.
+
+    :param rootfile: path to the ROOT file
+    :param workspace: name of the workspace
+    :param parameter: name of the scanned parameter
+    :param values: list of parameter values
+    :param output: output YAML file (one document per point)
+    :param jobs: number of worker processes
+    :param options: FitOptions for the conditional fits
+    :param on_point: optional callback for every finished point record
+    :return: list of the records of all points, sorted by value
+    '''
+    options = options or FitOptions()
+    done = completed_points(output)
+    todo = sorted(v for v in set(float(v) for v in values) if _key(v) not in done)
+    if done:
+        log.info('resuming scan: %s of %s points already done',len(values)-len(todo),len(values))
+
+    nchunks = min(jobs,len(todo))
+    tasks = [(parameter,todo[len(todo)*i//nchunks:len(todo)*(i+1)//nchunks],options) for i in range(nchunks)]
+
+    def on_record(record):
+        workers.append_record(output,record)
+        if on_point:
+            on_point(record)
+
+    workers.run_pool(rootfile,workspace,_scan_chunk,tasks,jobs,on_record)
+    return sorted(completed_points(output).values(),key = lambda r: r['value'])
@@ -0,0 +1,142 @@
+import os
+import glob
+import hftools.utils as hfutils
+from . import workers
+from . import FitOptions, fit, float_parameters
+from ..lazy import lazy_import
+ROOT = lazy_import('ROOT')
+np = lazy_import('numpy')
+
+import logging
+log = logging.getLogger(__name__)
+
+_start_snapshot = 'hftools_toy_generation'
+
+def generate(ws,seed):
+    '''
+    generate a pseudo-dataset from the model at the current parameter point, after randomizing
+    the global observables according to the constraint terms
+
+    :param ws: a HistFactory workspace object
+    :param seed: random seed
+    :return: the generated dataset
+    '''
+    mc = ws.obj('ModelConfig')
+    pdf = mc.GetPdf()
+    ROOT.RooRandom.randomGenerator().SetSeed(seed)
+    globs = mc.GetGlobalObservables()
+    if globs and globs.getSize():
+        generate_globals(pdf,globs)
+    return pdf.generate(mc.GetObservables(),ROOT.RooFit.Extended(True),ROOT.RooFit.AllBinned())
+
+def _generate_globals(pdf,globs):
+    observables = pdf.getObservables(globs)
+    if not observables.getSize():
+        return
+    generated = pdf.generate(observables,1).get(0)
+    for var in hfutils.iterate(observables):
+        var.setVal(generated.getRealValue(var.GetName()))
+
+def generate_globals(pdf,globs):
+    '''
+    randomize the global observables according to the constraint terms. For a simultaneous pdf
+    they are generated channel by channel from the constraints in each channel pdf, as done by
+    RooStats::ToyMCSampler, instead of from the full simultaneous pdf, which is not defined
+    without a value of the index category.
+
+    :param pdf: the model pdf
+    :param globs: set of global observables
+    '''
+    if not pdf.InheritsFrom('RooSimultaneous'):
+        _generate_globals(pdf,globs)
+        return
+    category = pdf.indexCat()
+    for i in range(category.numTypes()):
+        category.setBin(i)
+        channelpdf = pdf.getPdf(category.getLabel())
+        if channelpdf:
+            _generate_globals(channelpdf,globs)
+
+def _toy_batch(ws,task):
+    start,stop,seed,options = task
+    ws.saveSnapshot(_start_snapshot,ws.allVars())
+    columns = {'toy':[],'seed':[],'status':[],'nll':[],'edm':[],'ncalls':[]}
+    fitted = []
+    for toy in range(start,stop):
+        ws.loadSnapshot(_start_snapshot)
+        toyseed = seed + toy
+        try:
+            data = generate(ws,toyseed)
+            result = fit(ws,options,data)
+            row = {'status':int(result.status),'nll':result.nll,'edm':result.edm,'ncalls':result.ncalls}
+            fitted += [float_parameters(result.roofit)]
+        except Exception as e:
+            log.warning('toy %s failed: %s',toy,e)
+            row = {'status':-1,'nll':float('nan'),'edm':float('nan'),'ncalls':0}
+            fitted += [{}]
+        columns['toy'] += [toy]
+        columns['seed'] += [toyseed]
+        for k,v in row.iteritems():
+            columns[k] += [v]
+    ws.loadSnapshot(_start_snapshot)
+
+    for name in sorted(set(name for values in fitted for name in values)):
+        columns['par_{}'.format(name)] = [values.get(name,float('nan')) for values in fitted]
+    workers.emit({'start':start,'stop':stop,'columns':columns})
+
+def shard_name(directory,start):
+    return os.path.join(directory,'toys_{:08d}.npz'.format(start))
+
+def toys(rootfile,workspace,directory,ntoys,batch_size = 100,seed = 1234,jobs = 1,options = None,parpoint = None,on_batch = None):
+    '''
+    generate and fit pseudo-experiments. Toys are processed in batches on worker processes, toy i uses
+    the random seed seed+i so that results are reproducible independent of the batching. Every batch is
+    written as a columnar .npz shard as soon as it is done; batches with an existing shard are skipped.
+
+    :param rootfile: path to the ROOT file
+    :param workspace: name of the workspace
+    :param directory: output directory for the shards
+    :param ntoys: number of toys
+    :param batch_size: number of toys per batch (and shard)
+    :param seed: base random seed
+    :param jobs: number of worker processes
+    :param options: FitOptions for the toy fits
+    :param parpoint: parameter point (save_pars format) to generate the toys at (default: stored values)
+    :param on_batch: optional callback called with (start,stop) of every written batch
+    :return: list of the shard files
+    '''
+    options = options or FitOptions()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tasks = []
+    for start in range(0,ntoys,batch_size):
+        if os.path.exists(shard_name(directory,start)):
+            continue
+        tasks += [(start,min(start+batch_size,ntoys),seed,options)]
+    if len(tasks) < len(range(0,ntoys,batch_size)):
+        log.info('resuming toys: %s batches already done',len(range(0,ntoys,batch_size))-len(tasks))
+
+    def on_record(record):
+        if 'error' in record:
+            log.error('toy batch failed: %s',record['error'])
+            return
+        filename = shard_name(directory,record['start'])
+        tmpname = '{}.tmp.npz'.format(filename[:-len('.npz')])
+        np.savez_compressed(tmpname,**{k:np.asarray(v) for k,v in record['columns'].iteritems()})
+        os.rename(tmpname,filename)
+        if on_batch:
+            on_batch(record['start'],record['stop'])
+
+    workers.run_pool(rootfile,workspace,_toy_batch,tasks,jobs,on_record,parpoint = parpoint)
+    return sorted(glob.glob(os.path.join(directory,'toys_*.npz')))
+
+def load_toys(directory):
+    '''
+    :param directory: output directory of toys()
+    :return: dictionary of column name to numpy array over all toys
+    '''
+    shards = [np.load(f) for f in sorted(glob.glob(os.path.join(directory,'toys_*.npz')))]
+    names = sorted(set(name for shard in shards for name in shard.files))
+    return {name:np.concatenate([shard[name] if name in shard.files else np.full(len(shard['toy']),np.nan) for shard in shards])
+            for name in names}
@@ -0,0 +1,111 @@
+import os
+import traceback
+import functools
+import yaml
+from . import seed_parameters
+from .. import processes
+from ..lazy import lazy_import
+ROOT = lazy_import('ROOT')
+
+import logging
+log = logging.getLogger(__name__)
+
+# state of a worker process: every worker loads the workspace once and keeps it for all its tasks
+_state = {}
+
+def load_workspace(rootfile,workspace):
+    '''
+    :param rootfile: path to the ROOT file
+    :param workspace: name of the workspace in the file
+    :return: tuple of the (open) file and the workspace object
+    '''
+    f = ROOT.TFile.Open(rootfile)
+    if not f or f.IsZombie():
+        raise RuntimeError('could not open file {}'.format(rootfile))
+    ws = f.Get(str(workspace))
+    if not ws:
+        raise RuntimeError('could not find workspace {} in {}'.format(workspace,rootfile))
+    return f,ws
+
+def init_worker(rootfile,workspace,parpoint = None):
+    '''
+    initialize the state of a worker process: load the workspace once for all its tasks
+
+    :param parpoint: optional parameter point (as accepted by seed_parameters) to set after loading
+    '''
+    ROOT.gROOT.SetBatch(True)
+    f,ws = load_workspace(rootfile,workspace)
+    _state.update(file = f, workspace = ws, parpoint = parpoint)
+    restore()
+
+def restore():
+    '''
+    reset the worker workspace to the parameter point it was initialized with
+    '''
+    if _state.get('parpoint'):
+        seed_parameters(_state['workspace'],_state['parpoint'])
+
+def emit(record):
+    '''
+    send a result record to the main process
+    '''
+    processes.emit(record)
+
+def _run_task(func,task):
+    try:
+        func(_state['workspace'],task)
+    except Exception:
+        emit({'error':traceback.format_exc()})
+
+def run_pool(rootfile,workspace,func,tasks,jobs,on_record,parpoint = None):
+    '''
+    run func(workspace,task) for all tasks, in jobs worker processes that each load the workspace once.
+    Tasks report results with emit(record), on_record(record) is called in the main process for every
+    record as soon as it arrives.
+
+    :param func: module-level function taking the workspace and a task
+    :param tasks: list of (picklable) tasks
+    :param jobs: number of worker processes (1 runs the tasks in the current process)
+    :param on_record: callback for result records
+    :param parpoint: optional parameter point (as accepted by seed_parameters) to set in every worker after loading the workspace
+    :raises RuntimeError: if a worker fails to initialize or dies while running a task
+    '''
+    processes.run(functools.partial(_run_task,func),tasks,jobs,on_record = on_record,
+                  initializer = init_worker,initargs = (rootfile,workspace,parpoint))
+
+def append_record(filename,record):
+    '''
+    append a result record as a YAML document to a checkpoint file
+    '''
+    with open(filename,'a') as f:
+        f.write(yaml.safe_dump(record,default_flow_style = False,explicit_start = True))
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_records(filename):
+    '''
+    read the result records of a checkpoint file, skipping an incompletely written last record
+
+    :return: list of records
+    '''
+    if not os.path.exists(filename):
+        return []
+    documents, current = [], []
+    for line in open(filename):
+        if line.rstrip('\n') == '---' and current:
+            documents += [''.join(current)]
+            current = []
+        current += [line]
+    if current:
+        documents += [''.join(current)]
+
+    records = []
+    for document in documents:
+        try:
+            record = yaml.safe_load(document)
+        except yaml.YAMLError:
+            log.warning('skipping unreadable record in %s',filename)
+            continue
+        if isinstance(record,dict):
+            records += [record]
+    return records
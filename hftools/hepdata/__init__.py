@@ -2,6 +2,7 @@
 
 import rootcnv as hfrootcnv
 import hftools.utils as hfutils
+import hftools.profiling as profiling
 import logging
 log = logging.getLogger(__name__)
 
@@ -22,35 +23,65 @@ def nominal_with_all_systs(dep_info,**kwargs):
     if errors: outdata.update(errors = errors)
     return outdata
 
-def format_column_for_hepdata(ws,channel,observable,component,systematics,fitresult = None):
+@hfrootcnv.formatters.columnar_version_of(nominal_with_all_systs)
+def nominal_with_all_systs_columns(dep_columns,**kwargs):
+    nominal_key = [k for k in dep_columns.keys() if 'nominal' in k][0]
+    sysnames = [k.split('_')[1] for k in dep_columns.keys() if 'systhist' in k and 'up' in k]
+
+    nom_vals = dep_columns[nominal_key]['value']
+
+    sys_shifts = []
+    for sys in sysnames:
+        up_vals = dep_columns['systhist_{}_up'.format(sys)]['value']
+        dn_vals = dep_columns['systhist_{}_down'.format(sys)]['value']
+        sys_shifts += [(sys,(dn_vals-nom_vals).tolist(),(up_vals-nom_vals).tolist())]
+
+    column = []
+    for i,nom_val in enumerate(nom_vals.tolist()):
+        outdata = {'value':nom_val}
+        errors = [{'asymerror':{'minus':minus[i],'plus':plus[i]},'label':sys} for sys,minus,plus in sys_shifts]
+        if errors: outdata.update(errors = errors)
+        column += [outdata]
+    return column
+
+@profiling.timed('hepdata_column')
+def format_column_for_hepdata(ws,channel,observable,component,systematics,fitresult = None,nsamples = None):
+    '''
+    :param fitresult: fit result object, if given all variations are taken around the fitted
+                      parameter point and a total post-fit band is added as systhist_postfit_up/down
+    :param nsamples: number of covariance samples for the post-fit band (None for linear propagation)
+    '''
     log.warning('preparing HepData column for sample %s',component)
     loaded_param_sets = {}
     x = ws.var(hfutils.obsname(observable,channel))
     for name,defin in systematics.iteritems():
-        loaded_param_sets[name] = hfutils.getsys_pars(defin['HFname'],defin['HFtype'],
-                                                      workspace = ws, observable = x,
-                                                      **(defin.get('additional_args',{})))
+        getpars = hfutils.getsys_pars
+        fitargs = {}
         if fitresult:
-            hfutils.getsys_pars_from_fit(defin['HFname'],defin['HFtype'],workspace = ws, observable = x)
+            getpars = hfutils.getsys_pars_from_fit
+            fitargs = {'fitresult': fitresult}
+        loaded_param_sets[name] = getpars(defin['HFname'],defin['HFtype'],
+                                          workspace = ws, observable = x,
+                                          **dict(defin.get('additional_args',{}),**fitargs))
 
     log.info('working with parameter set: %s',loaded_param_sets)
 
-    firstnom = None
-    syst_hists = []
+    variation_names, variation_pars = [], []
     for name,paramset in loaded_param_sets.iteritems():
-        up,nom,down = [hfutils.extract_with_pars(ws,channel,observable,component,pardict) for pardict in paramset]
-
-        for h,tag in zip([up,down],['up','down']):
-            h.SetName('systhist_{}_{}'.format(name,tag))
-
-        if not firstnom:
-            firstnom = nom
-
-        syst_hists += [up,down]
-
-    if not loaded_param_sets:
-        #just take reference parameter set
-        firstnom = hfutils.extract_with_pars(ws,channel,observable,component,{})
+        up,nom,down = paramset
+        variation_names += ['systhist_{}_up'.format(name),'systhist_{}_down'.format(name)]
+        variation_pars  += [up,down]
+
+    if fitresult:
+        with hfutils.fit_point(ws,fitresult):
+            firstnom, syst_hists = hfutils.extract_variations(ws,channel,observable,component,variation_pars,reference_snapshot = None)
+        _, postfit_up, postfit_down = hfutils.postfit_variations(ws,channel,observable,component,fitresult,nsamples)
+        variation_names += ['systhist_postfit_up','systhist_postfit_down']
+        syst_hists += [postfit_up,postfit_down]
+    else:
+        firstnom, syst_hists = hfutils.extract_variations(ws,channel,observable,component,variation_pars)
+    for h,histname in zip(syst_hists,variation_names):
+        h.SetName(histname)
 
     firstnom.SetName("nominal_{}".format(channel))
 
@@ -67,18 +98,20 @@ def format_column_for_hepdata(ws,channel,observable,component,systematics,fitres
     return column_data
 
 
-def hepdata_table(ws,channel,observable,sampledef,fitresult = None):
+@profiling.timed('hepdata_table')
+def hepdata_table(ws,channel,observable,sampledef,fitresult = None,nsamples = None):
     '''
     :param ws: a workspace object
     :param channel: a HistFactory channel name
     :param observable: an observable name (usually `x`)
     :param sammpledef: sample definition dictionary
     :param fitresult: fit result object to use as basic for variations
+    :param nsamples: number of covariance samples for the post-fit band (None for linear propagation)
     :return: HepData-formatted dictionary (YAML/JSON serializable)
     '''
     compcols = []
     for sample,sampledef in sampledef:
-        compcols += [format_column_for_hepdata(ws,channel,observable,sample,sampledef['systs'],fitresult)]
+        compcols += [format_column_for_hepdata(ws,channel,observable,sample,sampledef['systs'],fitresult,nsamples)]
 
     datacol = {
      'header': {'name': 'Data'},
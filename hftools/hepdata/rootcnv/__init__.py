@@ -1,42 +1,93 @@
 #!/usr/bin/env python
 
 import itertools
+import numpy as np
 import formatters
+import hftools.utils as hfutils
+import hftools.profiling as profiling
+from hftools.lazy import lazy_import
+ROOT = lazy_import('ROOT')
 
 def _get_maxdim(histo):
     classname = histo.ClassName()
     maxdim = 1 if 'TH1' in classname else 2 if 'TH2' in classname else 3
     return maxdim
 
-def _extract_values_bin(histo,x,y,z,maxdim):
-    global_binnr = histo.GetBin(x,y,z)
-    value_data = {'value':histo.GetBinContent(global_binnr),
-                'error_plus':histo.GetBinErrorUp(*[x,y,z][0:maxdim]),
-                'error_minus':histo.GetBinErrorLow(*[x,y,z][0:maxdim])}
-    return value_data
+def _global_bins(histo,tags):
+    # same as histo.GetBin(x,y,z) for every row of tags, computed without per-bin calls
+    dim = histo.GetDimension()
+    nx,ny,nz = histo.GetNbinsX()+2,histo.GetNbinsY()+2,histo.GetNbinsZ()+2
+    x = np.clip(tags[:,0],0,nx-1)
+    if dim == 1:
+        return x
+    y = np.clip(tags[:,1],0,ny-1)
+    if dim == 2:
+        return x+nx*y
+    z = np.clip(tags[:,2],0,nz-1)
+    return x+nx*(y+ny*z)
 
-def _get_dep_info(inputsdict,indep_tag):
-    ndim = len(indep_tag)
-    x,y,z = list(indep_tag)+([1]*(3-ndim))
-    dep_vals = {k:_extract_values_bin(h,x,y,z,ndim) for k,h in inputsdict.iteritems()}
-    return dep_vals
+def _extract_values_columns(histo,tags,maxdim):
+    contents,errors = hfutils.histogram_buffers(histo)
+    global_bins = _global_bins(histo,tags)
+    values = contents[global_bins]
+    if histo.GetBinErrorOption() == ROOT.TH1.kNormal:
+        error_plus = error_minus = errors[global_bins]
+    else:
+        profiling.count('pyroot_bin_calls',2*len(tags))
+        error_plus  = np.array([histo.GetBinErrorUp(*tag[0:maxdim]) for tag in tags.tolist()],dtype = float)
+        error_minus = np.array([histo.GetBinErrorLow(*tag[0:maxdim]) for tag in tags.tolist()],dtype = float)
+    return {'value':values,'error_plus':error_plus,'error_minus':error_minus}
+
+def _get_dep_columns(inputsdict,taglist):
+    ndim = len(taglist[0])
+    tags = np.array([list(tag)+([1]*(3-ndim)) for tag in taglist],dtype = int)
+    return {k:_extract_values_columns(h,tags,ndim) for k,h in inputsdict.iteritems()}
+
+def _get_dep_info(dep_columns,nbins):
+    as_lists = {k:{field:column.tolist() for field,column in columns.iteritems()} for k,columns in dep_columns.iteritems()}
+    for i in range(nbins):
+        yield {k:{field:values[i] for field,values in columns.iteritems()} for k,columns in as_lists.iteritems()}
 
 def _get_indep_info(rep):
     ndim = _get_maxdim(rep)
-    bin_ranges = [range(1,n+1) for n in [rep.GetNbinsX(),rep.GetNbinsY(),rep.GetNbinsZ()]]
+    axes = [rep.GetXaxis(),rep.GetYaxis(),rep.GetZaxis()]
+    nbins = [rep.GetNbinsX(),rep.GetNbinsY(),rep.GetNbinsZ()]
+    profiling.count('pyroot_bin_calls',2*sum(nbins))
+    axis_info = [[{'low':axis.GetBinLowEdge(b),'width':axis.GetBinWidth(b)} for b in range(1,n+1)] for axis,n in zip(axes,nbins)]
+    bin_ranges = [range(1,n+1) for n in nbins]
     tag_list = []
     indep_list = []
     for x,y,z in itertools.product(*bin_ranges):
-        indep_storage = []
-        for axis,axisbin in [(rep.GetXaxis(),x),(rep.GetYaxis(),y),(rep.GetZaxis(),z)]:
-            low = axis.GetBinLowEdge(axisbin)
-            width = axis.GetBinWidth(axisbin)
-            indep_storage += [{'low':low,'width':width}]
+        indep_storage = [dict(axis_info[0][x-1]),dict(axis_info[1][y-1]),dict(axis_info[2][z-1])]
         indep_list += [indep_storage[0:ndim]]
         tag_list+=[(x,y,z)[0:ndim]]
     return (indep_list,tag_list)
 
-def convertROOT(table_definition):
+def _indep_columns(val_list):
+    return {k:np.array([x[k] for x in val_list],dtype = float) for k in ['low','width']}
+
+def _dep_values(conversion,taglist):
+    dep_columns = _get_dep_columns(conversion['inputs'],taglist)
+    formatter = conversion.pop('formatter',formatters.standard_format)
+    formatter_args = conversion.pop('formatter_args',{})
+    columnar_formatter = formatters.as_columnar(formatter)
+    if columnar_formatter:
+        for value in columnar_formatter(dep_columns,**formatter_args):
+            yield value
+    else:
+        for x in _get_dep_info(dep_columns,len(taglist)):
+            yield formatter(x,**formatter_args)
+
+@profiling.timed('format')
+def convertROOT(table_definition,lazy = False):
+    '''
+    convert a table definition with ROOT histogram inputs into HepData format
+
+    :param table_definition: the table definition (converted in place)
+    :param lazy: if True, the values of the dependent variables are generators that read the
+                 inputs only when iterated (e.g. while being written out)
+    :return: the converted table
+    '''
   #representative input for x values is first input of first data
     xrep = table_definition['dependent_variables'][0]['conversion']['inputs'].values()[0]
     indep_values,taglist = _get_indep_info(xrep)
@@ -45,13 +96,16 @@ def convertROOT(table_definition):
     for indep_def,val_list in zip(table_definition['independent_variables'],indep_val_lists):
         standard_conversion = {'formatter':formatters.bin_format}
         conversion = indep_def.pop('conversion') if 'conversion' in indep_def else standard_conversion
-        indep_def['values'] = list(conversion['formatter'](x,**conversion.get('formatter_args',{})) for x in val_list)
+        formatter_args = conversion.get('formatter_args',{})
+        columnar_formatter = formatters.as_columnar(conversion['formatter'])
+        if columnar_formatter:
+            indep_def['values'] = columnar_formatter(_indep_columns(val_list),**formatter_args)
+        else:
+            indep_def['values'] = list(conversion['formatter'](x,**formatter_args) for x in val_list)
   
     for col_def in table_definition['dependent_variables']:
         conversion = col_def.pop('conversion')
-        column_data = [_get_dep_info(conversion['inputs'],indep_tag) for indep_tag in taglist]
-        formatter = conversion.pop('formatter',formatters.standard_format)
-        formatter_args = conversion.pop('formatter_args',{})
-        col_def['values'] = list(formatter(x,**formatter_args) for x in column_data)
+        values = _dep_values(conversion,taglist)
+        col_def['values'] = values if lazy else list(values)
   
-    return table_definition
\ No newline at end of file
+    return table_definition
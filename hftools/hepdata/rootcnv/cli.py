@@ -1,51 +1,190 @@
 #!/usr/bin/env python
-import ROOT
 import yaml
 import os
+import collections
+import traceback
 
 from rootcnv import convertROOT, formatters
+from emitter import dump_table
+from resolver import ObjectResolver, group_by_file, table_identifiers
 import click
+import hftools.profiling as profiling
+import hftools.processes as processes
+
+@profiling.timed('yaml_dump')
+def write_table(filename,table,streaming = False):
+  with open(filename,'w') as f:
+    click.secho('writing {}'.format(filename), fg = 'green')
+    if streaming:
+      dump_table(table,f)
+    else:
+      f.write(yaml.safe_dump(table,default_flow_style = False))
+
+def get_formatter(name):
+  try:
+    return formatters.lookup(name)
+  except KeyError as e:
+    raise click.ClickException(str(e))
+
+def load_table(table,get_root_object):
+  #load files and formatters
+  for dep in table['dependent_variables']:
+    dep['conversion']['inputs']    = {k:get_root_object(v) for k,v in dep['conversion']['inputs'].iteritems()}
+    if 'formatter' in dep['conversion']:
+      dep['conversion']['formatter'] = get_formatter(dep['conversion']['formatter'])
+  for indep in table['independent_variables']:
+    if 'conversion' in indep:
+      indep['conversion']['formatter'] = get_formatter(indep['conversion']['formatter'])
+  return table
+
+def order_by_files(data):
+  '''
+  order table indices such that tables reading from the same files are converted one after another
+  '''
+  first_seen = {}
+  for table in data:
+    for filename in group_by_file(table_identifiers(table)):
+      first_seen.setdefault(filename,len(first_seen))
+  def file_order(i):
+    return sorted(first_seen[filename] for filename in group_by_file(table_identifiers(data[i])))
+  return sorted(range(len(data)),key = file_order)
+
+def convert_tables(tables,resolver,outdir,stream):
+  '''
+  convert (index,table) pairs, writing them directly if stream is set
+
+  :return: list of (index,converted table or None,error or None)
+  '''
+  resolver.plan([identifier for _,table in tables for identifier in table_identifiers(table)])
+  results = []
+  for index,table in tables:
+    identifiers = table_identifiers(table)
+    try:
+      with profiling.span('object_read'):
+        table = load_table(table,resolver.get)
+      converted = convertROOT(table,lazy = stream)
+      if stream:
+        write_table(os.path.join(outdir,'data{}.yaml'.format(index)),converted,streaming = True)
+        converted = None
+      results += [(index,converted,None)]
+    except Exception:
+      results += [(index,None,traceback.format_exc())]
+    finally:
+      for identifier in identifiers:
+        resolver.release(identifier)
+  return results
+
+_worker_state = {}
+def _init_worker(workdir,outdir,stream,max_open_files,max_objects,profile):
+  if workdir:
+    os.chdir(workdir)
+  if profile:
+    profiling.enable()
+  _worker_state.update(outdir = outdir, stream = stream, max_open_files = max_open_files, max_objects = max_objects)
+
+def _convert_in_worker(tables):
+  resolver = ObjectResolver(_worker_state['max_open_files'],_worker_state['max_objects'])
+  try:
+    results = []
+    outdir = _worker_state['outdir']
+    for index,converted,error in convert_tables(tables,resolver,outdir,_worker_state['stream']):
+      if converted is not None:
+        write_table(os.path.join(outdir,'data{}.yaml'.format(index)),converted)
+      results += [(index,error)]
+    worker_profile = profiling.report() if profiling.enabled() else None
+    profiling.reset()
+    return results,resolver.stats(),worker_profile
+  finally:
+    resolver.close()
+
+def convert_parallel(data,order,workdir,outdir,stream,jobs,max_open_files,max_objects):
+  #contiguous chunks of the file-ordered tables, so that workers share as few files as possible
+  nchunks = min(len(order),jobs*4)
+  chunks = [[(i,data[i]) for i in order[len(order)*c//nchunks:len(order)*(c+1)//nchunks]] for c in range(nchunks)]
+  failed = []
+  stats = collections.Counter()
+  def on_result(chunk,result):
+    results,worker_stats,worker_profile = result
+    stats.update(worker_stats)
+    if worker_profile:
+      profiling.merge(worker_profile)
+    failed.extend(report_failures(results))
+  def on_lost(chunk):
+    #a crashed worker (e.g. a segfault in ROOT) fails all tables of its chunk
+    indices = [index for index,_ in chunks[chunk]]
+    click.secho('worker died while converting tables {}'.format(', '.join(map(str,indices))), fg = 'red')
+    failed.extend(indices)
+  processes.run(_convert_in_worker,chunks,jobs,on_result = on_result,on_lost = on_lost,initializer = _init_worker,
+                initargs = (workdir,outdir,stream,max_open_files,max_objects,profiling.enabled()))
+  return sorted(failed),stats
+
+def report_failures(results):
+  failed = []
+  for result in results:
+    index,error = result[0],result[-1]
+    if error:
+      click.secho('conversion of table {} failed:\n{}'.format(index,error), fg = 'red')
+      failed += [index]
+  return failed
+
+def report_stats(stats):
+  counts = {k:stats.get(k,0) for k in ['hits','misses','reads','file_opens','evictions']}
+  click.secho('input objects: {hits} cache hits, {misses} misses, {reads} reads, {file_opens} file opens, {evictions} evictions'.format(**counts), fg = 'green')
 
 @click.command()
 @click.argument('inputfile')
 @click.option('-d','--workdir',default = None, help = 'change working directory (relative to which inputs are defined)')
-def converter(inputfile,workdir):
-  
-  files_cache,objects_cache = {},{}
-  def get_root_object(identifiers):
-    if identifiers in objects_cache:
-      return objects_cache[identifiers]
-    filename,path = identifiers.split(':',1)
-    if filename in files_cache:
-      obj = files_cache[filename].Get(path)
-      if not obj: raise RuntimeError
-      objects_cache[identifiers] = obj
-      return get_root_object(identifiers)
-    files_cache[filename] = ROOT.TFile.Open(filename)
-    return get_root_object(identifiers)
-  
-  data = yaml.load(open(inputfile))
+@click.option('--stream/--no-stream',default = False, help = 'write each table as soon as it is converted and release its ROOT objects')
+@click.option('-j','--jobs',default = 1, help = 'number of worker processes converting tables in parallel')
+@click.option('--max-open-files',default = 64, help = 'maximum number of simultaneously open input files (per process)')
+@click.option('--max-objects',default = 1000, help = 'maximum number of cached input objects (per process)')
+@click.option('--profile',default = None, help = 'write a per-stage timing breakdown to this JSON file')
+@click.option('--cprofile',default = None, help = 'write a cProfile dump to this file')
+def converter(inputfile,workdir,stream,jobs,max_open_files,max_objects,profile,cprofile):
+  session = profiling.Session(*[os.path.abspath(f) if f else None for f in [profile,cprofile]]).start()
+  try:
+    convert(inputfile,workdir,stream,jobs,max_open_files,max_objects)
+  finally:
+    session.stop()
+    if profile:
+      for line in profiling.summary():
+        click.secho(line)
+
+def convert(inputfile,workdir,stream,jobs,max_open_files,max_objects):
+  with profiling.span('yaml_load'):
+    data = yaml.load(open(inputfile))
 
   original_dir = os.path.abspath(os.curdir)
   if workdir:
     os.chdir(os.path.abspath(workdir))
 
-  converted_tables = []
-  for table in data:
-    #load files and formatters
-    for dep in table['dependent_variables']:
-      dep['conversion']['inputs']    = {k:get_root_object(v) for k,v in dep['conversion']['inputs'].iteritems()}
-      if 'formatter' in dep['conversion']:
-        dep['conversion']['formatter'] = getattr(formatters,dep['conversion']['formatter'])
-    for indep in table['independent_variables']:
-      if 'conversion' in indep:
-        indep['conversion']['formatter'] = getattr(formatters,indep['conversion']['formatter'])
-
-    converted_tables += [convertROOT(table)]
-  
-  os.chdir(original_dir)
-  for i,data in enumerate(converted_tables):
-    filename = 'data{}.yaml'.format(i)
-    with open(filename,'w') as f:
-      click.secho('writing {}'.format(filename), fg = 'green')
-      f.write(yaml.safe_dump(data,default_flow_style = False))
+  order = order_by_files(data)
+
+  if jobs > 1:
+    try:
+      failed,stats = convert_parallel(data,order,os.path.abspath(os.curdir),original_dir,stream,jobs,max_open_files,max_objects)
+    finally:
+      os.chdir(original_dir)
+    report_stats(stats)
+    if failed:
+      raise click.ClickException('conversion failed for tables {}'.format(', '.join(map(str,failed))))
+    return
+
+  resolver = ObjectResolver(max_open_files,max_objects)
+  tables = [(i,data[i]) for i in order]
+  del data
+  try:
+    results = convert_tables(tables,resolver,original_dir,stream)
+  finally:
+    resolver.close()
+    os.chdir(original_dir)
+  del tables
+  report_stats(resolver.stats())
+
+  #write every converted table before reporting the failed ones, as in the parallel mode
+  for i,data in sorted((index,converted) for index,converted,_ in results if converted is not None):
+    write_table('data{}.yaml'.format(i),data)
+
+  failed = sorted(report_failures(results))
+  if failed:
+    raise click.ClickException('conversion failed for tables {}'.format(', '.join(map(str,failed))))
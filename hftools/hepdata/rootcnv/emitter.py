@@ -0,0 +1,49 @@
+# incremental YAML output for converted tables: the values of each variable are written
+# record by record, so that (lazily converted) tables are never held in memory as a whole.
+# The output is the same as yaml.safe_dump(table,default_flow_style = False)
+
+import yaml
+
+_variable_lists = ['dependent_variables','independent_variables']
+
+def _dump(data):
+    return yaml.safe_dump(data,default_flow_style = False)
+
+def _write_indented(stream,text,first_prefix,prefix):
+    for i,line in enumerate(text.splitlines(True)):
+        stream.write((first_prefix if i == 0 else prefix) + line)
+
+def _write_list(stream,key,items,key_prefix,item_prefix,item_writer):
+    empty = True
+    for item in items:
+        if empty:
+            stream.write('{}{}:\n'.format(key_prefix,key))
+            empty = False
+        item_writer(stream,item,item_prefix)
+    if empty:
+        stream.write('{}{}: []\n'.format(key_prefix,key))
+
+def _write_value(stream,value,prefix):
+    _write_indented(stream,_dump([value]),prefix,prefix)
+
+def _write_variable(stream,variable,prefix):
+    key_prefix, item_prefix = prefix + '- ', prefix + '  '
+    for key in sorted(variable):
+        if key == 'values':
+            _write_list(stream,key,variable[key],key_prefix,item_prefix,_write_value)
+        else:
+            _write_indented(stream,_dump({key:variable[key]}),key_prefix,item_prefix)
+        key_prefix = item_prefix
+
+def dump_table(table,stream):
+    '''
+    write a converted HepData table as block-style YAML
+
+    :param table: the converted table, values may be lists or iterables of value records
+    :param stream: a file-like object
+    '''
+    for key in sorted(table):
+        if key in _variable_lists:
+            _write_list(stream,key,table[key],'','',_write_variable)
+        else:
+            stream.write(_dump({key:table[key]}))
@@ -1,6 +1,46 @@
 # conventions for histogram formatters
 # bin_info_dep is a dictionary of {'histoname':{'value':v,'error_plus':plus_error,'error_minus':minus_error}}
 # indep_info is a dictionary {'low':low_edge,'width':bin_width}
+#
+# columnar formatters (marked with the @columnar decorator) are called once per column instead of once per bin:
+# dep_columns is a dictionary of {'histoname':{'value':values,'error_plus':plus_errors,'error_minus':minus_errors}}
+# indep_columns is a dictionary {'low':low_edges,'width':bin_widths}
+# where all entries are numpy arrays over the bins, and they return the list of value records for the column
+
+def columnar(func):
+    '''
+    mark a formatter as columnar
+    '''
+    func.columnar = True
+    return func
+
+def columnar_version_of(legacy):
+    '''
+    mark a formatter as the columnar equivalent of a per-bin formatter, which is then used in its place
+    '''
+    def decorator(func):
+        legacy.columnar_version = columnar(func)
+        return func
+    return decorator
+
+def as_columnar(formatter):
+    '''
+    :param formatter: a formatter function
+    :return: the columnar version of the formatter or None if it only supports the per-bin protocol
+    '''
+    if getattr(formatter,'columnar',False):
+        return formatter
+    return getattr(formatter,'columnar_version',None)
+
+def lookup(name):
+    '''
+    :param name: name of a formatter defined in this module
+    :return: the formatter function
+    '''
+    formatter = globals().get(name)
+    if not callable(formatter):
+        raise KeyError('unknown formatter {}'.format(name))
+    return formatter
 
 def standard_format(dep_info,**kwargs):
     '''
@@ -30,4 +70,41 @@ def bin_format(indep_info,**kwargs):
     if style=='central_value':
         return {'value':(indep_info['low']+indep_info['width'])/2.}
     else:
-        return {'low':indep_info['low'], 'high':indep_info['low']+indep_info['width']}
\ No newline at end of file
+        return {'low':indep_info['low'], 'high':indep_info['low']+indep_info['width']}
+
+@columnar_version_of(standard_format)
+def standard_format_columns(dep_columns,**kwargs):
+    '''
+    Standard Formatter (columnar)
+    '''
+    v = dep_columns.values()[0]
+    error_config = kwargs.get('error_config',None)
+    errors = None
+    if error_config == 'asymmetric':
+        errors = [{'asymerror':{'minus':minus,'plus':plus},'label':kwargs['label']}
+                  for minus,plus in zip((-v['error_minus']).tolist(),v['error_plus'].tolist())]
+    if error_config == 'symmetric':
+        errors = [{'symerror':sym,'label':kwargs['label']}
+                  for sym in ((v['error_plus']+v['error_minus'])/2).tolist()]
+    data = [{'value':value} for value in v['value'].tolist()]
+    if errors:
+        for d,error in zip(data,errors):
+            d['errors'] = [error]
+    return data
+
+@columnar_version_of(nominal_with_variations_formatter)
+def nominal_with_variations_columns(dep_columns,**kwargs):
+    nom,up,down = [dep_columns[x]['value'] for x in ['nominal','up','down']]
+    return [{'value':n,'errors':[
+              {'asymerror':{'minus':minus,'plus':plus},
+               'label':kwargs['label']}
+            ]} for n,minus,plus in zip(nom.tolist(),(down-nom).tolist(),(up-nom).tolist())]
+
+@columnar_version_of(bin_format)
+def bin_format_columns(indep_columns,**kwargs):
+    style = kwargs.get('style',None)
+    low,width = indep_columns['low'],indep_columns['width']
+    if style=='central_value':
+        return [{'value':v} for v in ((low+width)/2.).tolist()]
+    else:
+        return [{'low':l, 'high':h} for l,h in zip(low.tolist(),(low+width).tolist())]
@@ -0,0 +1,141 @@
+# resolution of 'file:path' input identifiers to ROOT objects. Identifiers are collected
+# up front and grouped by file, so that every file is opened once and all objects needed
+# from it are read in a single pass. Open files and cached objects are bounded (LRU).
+
+import collections
+import hftools.profiling as profiling
+from hftools.lazy import lazy_import
+ROOT = lazy_import('ROOT')
+
+def split_identifier(identifier):
+    filename,path = identifier.split(':',1)
+    return filename,path
+
+def table_identifiers(table):
+    '''
+    :param table: a table definition as read from the converter YAML
+    :return: list of the input identifiers of the table
+    '''
+    return [v for dep in table['dependent_variables'] for v in dep['conversion']['inputs'].values()]
+
+def group_by_file(identifiers):
+    '''
+    :param identifiers: list of 'file:path' identifiers
+    :return: ordered dictionary of file name to sorted list of paths
+    '''
+    grouped = collections.OrderedDict()
+    for identifier in identifiers:
+        filename,path = split_identifier(identifier)
+        grouped.setdefault(filename,set()).add(path)
+    return collections.OrderedDict((k,sorted(v)) for k,v in grouped.iteritems())
+
+def _seek_position(rootfile,path):
+    dirname,_,basename = path.rpartition('/')
+    directory = rootfile.GetDirectory(dirname) if dirname else rootfile
+    key = directory.GetKey(basename) if directory else None
+    return key.GetSeekKey() if key else 0
+
+class ObjectResolver(object):
+    '''
+    bounded, file-grouped cache of ROOT objects identified by 'file:path' strings
+    '''
+    def __init__(self,max_open_files = 64,max_objects = 1000):
+        self.max_open_files = max_open_files
+        self.max_objects = max_objects
+        self.files = collections.OrderedDict()
+        self.objects = collections.OrderedDict()
+        self.pending = collections.defaultdict(collections.Counter)
+        self.counts = collections.Counter()
+
+    def plan(self,identifiers):
+        '''
+        register upcoming uses of identifiers, used for bulk reads and for releasing objects after their last use
+
+        :param identifiers: list of 'file:path' identifiers (repeated for every use)
+        '''
+        for identifier in identifiers:
+            filename,path = split_identifier(identifier)
+            self.pending[filename][path] += 1
+
+    def _open(self,filename):
+        if filename in self.files:
+            self.files[filename] = self.files.pop(filename)
+            return self.files[filename]
+        while len(self.files) >= self.max_open_files:
+            self._close_file(next(iter(self.files)))
+        with profiling.span('file_open'):
+            rootfile = ROOT.TFile.Open(filename)
+        if not rootfile or rootfile.IsZombie():
+            raise RuntimeError('could not open file {}'.format(filename))
+        self.counts['file_opens'] += 1
+        self.files[filename] = rootfile
+        return rootfile
+
+    def _close_file(self,filename):
+        self.files.pop(filename).Close()
+
+    def _store(self,identifier,obj):
+        while len(self.objects) >= self.max_objects:
+            self.objects.popitem(last = False)
+            self.counts['evictions'] += 1
+        self.objects[identifier] = obj
+
+    def _read(self,rootfile,filename,path):
+        obj = rootfile.Get(path)
+        if not obj:
+            raise RuntimeError('could not find object {} in file {}'.format(path,filename))
+        if hasattr(obj,'SetDirectory'):
+            #detach from the file so that the object survives closing it
+            obj.SetDirectory(0)
+            ROOT.SetOwnership(obj,True)
+        self.counts['reads'] += 1
+        return obj
+
+    def _load(self,identifier):
+        filename,path = split_identifier(identifier)
+        rootfile = self._open(filename)
+        room = max(self.max_objects - len(self.objects) - 1,0)
+        others = [p for p in self.pending[filename] if p != path and '{}:{}'.format(filename,p) not in self.objects]
+        batch = [path] + others[:room]
+        for p in sorted(batch,key = lambda p: _seek_position(rootfile,p)):
+            self._store('{}:{}'.format(filename,p),self._read(rootfile,filename,p))
+        if not self.pending[filename]:
+            self._close_file(filename)
+
+    def get(self,identifier):
+        '''
+        :param identifier: a 'file:path' identifier
+        :return: the ROOT object
+        '''
+        if identifier in self.objects:
+            self.counts['hits'] += 1
+            self.objects[identifier] = self.objects.pop(identifier)
+            return self.objects[identifier]
+        self.counts['misses'] += 1
+        self._load(identifier)
+        return self.objects[identifier]
+
+    def release(self,identifier):
+        '''
+        mark one planned use of an identifier as done. Objects and files without further planned uses are released.
+
+        :param identifier: a 'file:path' identifier
+        '''
+        filename,path = split_identifier(identifier)
+        pending = self.pending[filename]
+        if pending[path] > 0:
+            pending[path] -= 1
+        if pending[path] == 0:
+            pending.pop(path)
+            self.objects.pop(identifier,None)
+        if not pending and filename in self.files:
+            self._close_file(filename)
+
+    def close(self):
+        self.objects.clear()
+        for filename in list(self.files):
+            self._close_file(filename)
+
+    def stats(self):
+        return {'hits':self.counts['hits'],'misses':self.counts['misses'],'reads':self.counts['reads'],
+                'file_opens':self.counts['file_opens'],'evictions':self.counts['evictions']}
@@ -0,0 +1,62 @@
+import sys
+import importlib
+
+_import_hooks = {}
+
+class LazyModule(object):
+    '''
+    proxy for a module that is only imported on first attribute access. Used for heavy
+    dependencies (ROOT, numpy, ...) so that e.g. command line tools start up fast.
+    '''
+    def __init__(self,name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = load(self.__dict__['_lazy_name'])
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self,attr):
+        return getattr(self._load(),attr)
+
+    def __setattr__(self,attr,value):
+        setattr(self._load(),attr,value)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self.__dict__['_lazy_name'])
+
+def load(name):
+    '''
+    import a module and run the hooks registered for it
+
+    :param name: module name
+    :return: the module
+    '''
+    module = importlib.import_module(name)
+    for hook in _import_hooks.pop(name,[]):
+        hook(module)
+    return module
+
+def lazy_import(name):
+    '''
+    :param name: module name
+    :return: a proxy that imports the module on first use
+    '''
+    return LazyModule(name)
+
+def on_import(name,hook):
+    '''
+    register a function to be called with the module once it is loaded through a lazy proxy.
+    If the module is already imported, the hook is called right away. Modules importing the
+    module directly bypass the hooks, hftools itself therefore only uses lazy proxies for ROOT.
+
+    :param name: module name
+    :param hook: callable taking the module
+    '''
+    if name in sys.modules:
+        hook(sys.modules[name])
+    else:
+        _import_hooks.setdefault(name,[]).append(hook)
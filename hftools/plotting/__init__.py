@@ -1,13 +1,32 @@
-import ROOT
-import numpy as np
-import math
-from brewer2mpl import qualitative
 import itertools
 from .. import utils as hfutils
+from ..lazy import lazy_import
+from .. import profiling
+from .. import processes
+ROOT = lazy_import('ROOT')
+np = lazy_import('numpy')
+brewer2mpl = lazy_import('brewer2mpl')
 
 import logging
 log = logging.getLogger(__name__)
 
+def _graph_arrays(graph):
+    n = graph.GetN()
+    def read(buf):
+        return np.frombuffer(buf,dtype = 'f8',count = n).copy() if n else np.zeros(0)
+    points = [read(graph.GetX()),read(graph.GetY())]
+    if graph.InheritsFrom('TGraphAsymmErrors') or graph.InheritsFrom('TGraphBentErrors'):
+        return points + [read(buf) for buf in [graph.GetEXlow(),graph.GetEXhigh(),graph.GetEYlow(),graph.GetEYhigh()]]
+    if graph.InheritsFrom('TGraphErrors'):
+        ex,ey = read(graph.GetEX()),read(graph.GetEY())
+        return points + [ex,ex.copy(),ey,ey.copy()]
+    # a plain TGraph has no error buffers
+    return points + [np.zeros(n) for _ in range(4)]
+
+def _asymm_graph(x,y,exl,exh,eyl,eyh):
+    arrays = [np.ascontiguousarray(a,dtype = float) for a in [x,y,exl,exh,eyl,eyh]]
+    return ROOT.TGraphAsymmErrors(len(arrays[0]),*arrays)
+
 def combine_graphs(graphs,positionhist):
     '''
     return combined band of bands summed in quadrature for each bin
@@ -16,19 +35,19 @@ def combine_graphs(graphs,positionhist):
     :param positionhist: Histogram that controls the y-position of resulting graph
     :return: combined TGraph object
     '''
-    result = graphs[0].Clone()
-    for i in range(result.GetN()):
-        x,y = np.array([0],dtype = float),np.array([0],dtype = float)
-        result.GetPoint(i,x,y)
+    x,_,exl,exh = _graph_arrays(graphs[0])[:4]
+    widths = np.array([arrays[4]+arrays[5] for arrays in map(_graph_arrays,graphs)])
+    total_error = np.sqrt(np.sum(widths**2,axis = 0))
 
-        total_widths = [g.GetErrorYhigh(i)+g.GetErrorYlow(i) for g in graphs]
-        total_error = math.sqrt(sum(w**2 for w in total_widths))
-    
-        position = positionhist.GetBinContent(positionhist.FindBin(x))
+    edges = hfutils.histogram_edges(positionhist)
+    cells,_ = hfutils.histogram_buffers(positionhist)
+    position = cells[np.searchsorted(edges,x,side = 'right')]
 
-        result.SetPoint(i,x,position)
-        result.SetPointEYhigh(i,total_error/2.0)
-        result.SetPointEYlow(i,total_error/2.0)
+    result = _asymm_graph(x,position,exl,exh,total_error/2.0,total_error/2.0)
+    result.SetName(graphs[0].GetName())
+    result.SetTitle(graphs[0].GetTitle())
+    for attributes in [ROOT.TAttLine,ROOT.TAttFill,ROOT.TAttMarker]:
+        attributes.Copy(graphs[0],result)
     return result
 
 def _getlegend(*args,**kwargs):
@@ -52,45 +71,54 @@ def make_band_root(up,down,nominal,binmin = 0,binmax = 1):
     :param nominal: the nominal histogram, used to position the band vertically
     :return: the TGraph band
     '''
-    g = ROOT.TGraphAsymmErrors(nominal.GetNbinsX())
-    for i in range(1,nominal.GetNbinsX()+1):
-        x_nom = nominal.GetBinCenter(i)
-        x_lo = nominal.GetBinLowEdge(i)
-        x_hi = nominal.GetBinLowEdge(i)+nominal.GetBinWidth(i)
-        assert x_nom
+    edges = hfutils.histogram_edges(nominal)
+    x_lo, binwidth = edges[:-1], np.diff(edges)
+    y_nom,y_up,y_down = [hfutils.histogram_arrays(h)[0] for h in [nominal,up,down]]
 
-        y_nom,y_up,y_down = [x.GetBinContent(i) for x in [nominal,up,down]]
+    center = x_lo + binwidth*(binmax-binmin)/2.0
+    left   = x_lo + binwidth*binmin
+    right  = x_lo + binwidth*binmax
 
-        binwidth = x_hi-x_lo
-        center = x_lo + binwidth*(binmax-binmin)/2.0
-        left   = x_lo + binwidth*binmin
-        right  = x_lo + binwidth*binmax
+    return _asymm_graph(center,y_nom,center-left,right-center,y_nom-y_down,y_up-y_nom)
 
-        g.SetPoint(i-1,center,y_nom)
-        g.SetPointEXhigh(i-1,right-center)
-        g.SetPointEXlow(i-1,center-left)
-        g.SetPointEYhigh(i-1,y_up-y_nom)
-        g.SetPointEYlow(i-1,y_nom-y_down)
-    return g
+def _palette(ncolors):
+    colormap = brewer2mpl.qualitative.Paired.get(ncolors,None)
+    if not colormap:
+        colormap = brewer2mpl.qualitative.Paired['max']
+    return colormap.hex_colors
 
-def quickplot(ws,channel,obs,components,filename,title,xaxis,yaxis,singlebin,dimensions,logy):
+@profiling.timed('extract_hists')
+def extract_hists(ws,channel,obs,components,fitresult = None,nsamples = None):
     '''
     :param ws: a HistFactory workspace
     :param channel: a channel name
     :param obs: an observable name
-    :param components: a list of components to plots (plot will respect order given here)
-    :return: None
+    :param components: a list of components
+    :param fitresult: a RooFitResult, if given the post-fit uncertainty band of the stack is added
+    :param nsamples: number of covariance samples for the band (None for linear propagation)
+    :return: dictionary with the data histogram, the component histograms and optionally the band histograms
     '''
-    weighted_hists = {
+    hists = {
         'data': hfutils.extract_data(ws,channel,obs),
         'model':{c: hfutils.extract(ws,channel,obs,c) for c in components}
     }
+    if fitresult:
+        hists['band'] = hfutils.postfit_variations(ws,channel,obs,list(components),fitresult,nsamples)
+    return hists
+
+@profiling.timed('draw')
+def draw(c,weighted_hists,components,title,xaxis,yaxis,singlebin,logy):
+    '''
+    draw a stacked plot of the components together with the data into a canvas
 
+    :param c: the canvas to draw into
+    :param weighted_hists: histograms as returned by extract_hists
+    :param components: a list of components to plots (plot will respect order given here)
+    :return: list of ROOT objects that need to be kept alive while the canvas is used
+    '''
+    c.cd()
     stack = ROOT.THStack()
-    colormap = qualitative.Paired.get(len(components),None)
-    if not colormap:
-        colormap = qualitative.Paired['max']
-    colors = colormap.hex_colors
+    colors = _palette(len(components))
 
     comphists = []
     for color,component in zip(itertools.cycle(colors),components):
@@ -101,8 +129,6 @@ def quickplot(ws,channel,obs,components,filename,title,xaxis,yaxis,singlebin,dim
         comphists += [(component,plotcomp)]
         stack.Add(plotcomp)
 
-    width,height = map(int,dimensions.split('x'))
-    c = ROOT.TCanvas('c','c',width,height)
     datahist = weighted_hists['data']
     datahist.SetMarkerStyle(20);
     datahist.SetLineColor(ROOT.kBlack)
@@ -125,20 +151,220 @@ def quickplot(ws,channel,obs,components,filename,title,xaxis,yaxis,singlebin,dim
     else:
         frame.GetXaxis().SetTitle(xaxis or '')
 
-    if logy:
-        c.SetLogy()
+    c.SetLogy(1 if logy else 0)
 
     frame.Draw()
     ROOT.gStyle.SetOptStat(0)
     stack.Draw('histsame')
+
+    band = None
+    if 'band' in weighted_hists:
+        nominal,up,down = weighted_hists['band']
+        band = make_band_root(up,down,nominal)
+        band.SetFillStyle(3354)
+        band.SetFillColor(ROOT.kBlack)
+        band.SetLineWidth(0)
+        band.Draw('2same')
+
     datahist.Draw('sameE0')
 
     x, y, linewidth = 0.7, 0.7, 0.03
 
-    l = _getlegend(x,y,x+0.1,y+linewidth*(len(comphists)+1), fontsize = 15)
+    nentries = len(comphists) + (2 if band is not None else 1)
+    l = _getlegend(x,y,x+0.1,y+linewidth*nentries, fontsize = 15)
     l.AddEntry(datahist,'data','pl')
+    if band is not None:
+        l.AddEntry(band,'post-fit unc.','f')
     for comp,h in reversed(comphists):
         l.AddEntry(h,comp,'f')
 
     l.Draw()
-    c.SaveAs(filename)
\ No newline at end of file
+    return [stack,frame,datahist,l,band] + [h for _,h in comphists]
+
+class StackPlot(object):
+    '''
+    a stacked plot drawn once into a canvas, whose histograms can afterwards be re-filled
+    in place for other parameter points instead of drawing a new set of ROOT objects
+    '''
+    def __init__(self,c,weighted_hists,components,title,xaxis,yaxis,singlebin,logy):
+        self.canvas = c
+        self.components = components
+        self.objects = draw(c,weighted_hists,components,title,xaxis,yaxis,singlebin,logy)
+        self.stack,self.frame,self.datahist,self.legend,self.band = self.objects[:5]
+        self.comphists = self.objects[5:]
+
+    def fill(self,weighted_hists,title = None):
+        '''
+        :param weighted_hists: histograms as returned by extract_hists, for the same components
+        :param title: new title of the plot (None to keep it)
+        '''
+        for component,h in zip(self.components,self.comphists):
+            h.Reset('ICE')
+            h.Add(weighted_hists['model'][component])
+        self.datahist.Reset('ICE')
+        self.datahist.Add(weighted_hists['data'])
+        self.frame.GetYaxis().SetRangeUser(0,self.datahist.GetMaximum()*1.5)
+        if title is not None:
+            self.frame.SetTitle(title)
+
+        if self.band is not None and 'band' in weighted_hists:
+            nominal,up,down = weighted_hists['band']
+            x,y,exl,exh,eyl,eyh = _graph_arrays(make_band_root(up,down,nominal))
+            for i in range(len(x)):
+                self.band.SetPoint(i,x[i],y[i])
+                self.band.SetPointError(i,exl[i],exh[i],eyl[i],eyh[i])
+
+        self.stack.Modified()
+        self.canvas.Modified()
+        self.canvas.Update()
+
+    def save(self,filenames):
+        for filename in filenames:
+            with profiling.span('canvas_save'):
+                self.canvas.SaveAs(filename)
+
+_canvases = {}
+
+def _canvas(dimensions):
+    '''
+    cleared canvas of the given size, canvases are created once per size and process and then reused
+    '''
+    c = _canvases.get(dimensions)
+    if c is None:
+        width,height = map(int,dimensions.split('x'))
+        c = _canvases[dimensions] = ROOT.TCanvas('c_{}'.format(dimensions),'c',width,height)
+    c.Clear()
+    return c
+
+def quickplot(ws,channel,obs,components,filename,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult = None,nsamples = None):
+    '''
+    :param ws: a HistFactory workspace
+    :param channel: a channel name
+    :param obs: an observable name
+    :param components: a list of components to plots (plot will respect order given here)
+    :param fitresult: a RooFitResult to draw a post-fit uncertainty band from
+    :param nsamples: number of covariance samples for the band (None for linear propagation)
+    :return: None
+    '''
+    weighted_hists = extract_hists(ws,channel,obs,components,fitresult,nsamples)
+    c = _canvas(dimensions)
+    keep = draw(c,weighted_hists,components,title,xaxis,yaxis,singlebin,logy)
+    with profiling.span('canvas_save'):
+        c.SaveAs(filename)
+    del keep
+
+_points_snapshot = 'hftools_quickplot_points'
+
+def quickplot_points(ws,channel,obs,components,parpoints,output,formats = ('pdf',),title = None,xaxis = None,yaxis = None,
+                     singlebin = False,dimensions = '600x600',logy = False):
+    '''
+    plot a channel at several parameter points, each saved in several formats. The plot is drawn
+    once, for further points the histograms are re-filled in place and every format is saved from
+    the same canvas.
+
+    :param ws: a HistFactory workspace
+    :param channel: a channel name
+    :param obs: an observable name
+    :param components: a list of components to plots (plot will respect order given here)
+    :param parpoints: list of (label, parameter point) pairs, parameter points in the format written by save_pars
+    :param output: output file name pattern (without extension) with a {label} placeholder
+    :param formats: list of file extensions to save each plot as
+    :param title: plot title, may contain a {label} placeholder
+    :return: list of written files
+    '''
+    c = _canvas(dimensions)
+    plot = None
+    written = []
+    #every point is applied on top of the initial parameter values, which are restored at the end
+    ws.saveSnapshot(_points_snapshot,ws.allVars())
+    try:
+        for label,parpoint_data in parpoints:
+            ws.loadSnapshot(_points_snapshot)
+            hfutils.set_pars2(ws,parpoint_data)
+            weighted_hists = extract_hists(ws,channel,obs,components)
+            plottitle = (title or '').format(label = label)
+            if plot is None:
+                plot = StackPlot(c,weighted_hists,components,plottitle,xaxis,yaxis,singlebin,logy)
+            else:
+                plot.fill(weighted_hists,plottitle)
+            filenames = ['{}.{}'.format(output.format(label = label),fmt) for fmt in formats]
+            plot.save(filenames)
+            written += filenames
+    finally:
+        ws.loadSnapshot(_points_snapshot)
+    return written
+
+def _plot_tasks(ws,plots,output,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult,nsamples):
+    '''
+    extract the histograms of the plots of quickplot_many, shared by the ROOT and matplotlib backends
+
+    :return: tuple of a flag whether all plots go into one (multipage) document and the list of
+             (weighted histograms, components, file name, style) tasks
+    '''
+    multipage = '{channel}' not in output
+    if multipage and not output.endswith('.pdf'):
+        raise ValueError('output without {channel} placeholder must be a .pdf file')
+
+    tasks = []
+    for channel,obs,components in plots:
+        components = components or hfutils.samples(ws,channel)
+        style = {
+            'title': (title or '').format(channel = channel,observable = obs),
+            'xaxis': xaxis, 'yaxis': yaxis, 'singlebin': singlebin,
+            'dimensions': dimensions, 'logy': logy
+        }
+        filename = output if multipage else output.format(channel = channel,observable = obs)
+        tasks += [(extract_hists(ws,channel,obs,components,fitresult,nsamples),components,filename,style)]
+    return multipage,tasks
+
+def _render_all(render,tasks,jobs):
+    '''
+    render plots in a process pool that fails instead of hanging if a worker dies
+
+    :param render: picklable function rendering a task and returning the written file
+    :param tasks: list of tasks
+    :param jobs: number of worker processes
+    :return: list of written files, in the order of the tasks
+    '''
+    written = [None]*len(tasks)
+    processes.run(render,tasks,jobs,on_result = written.__setitem__)
+    return written
+
+def _render(task):
+    weighted_hists,components,filename,style = task
+    ROOT.gROOT.SetBatch(True)
+    c = _canvas(style['dimensions'])
+    keep = draw(c,weighted_hists,components,style['title'],style['xaxis'],style['yaxis'],style['singlebin'],style['logy'])
+    with profiling.span('canvas_save'):
+        c.SaveAs(filename)
+    del keep
+    return filename
+
+def quickplot_many(ws,plots,output,title = None,xaxis = None,yaxis = None,singlebin = False,dimensions = '600x600',logy = False,jobs = 1,
+                   fitresult = None,nsamples = None):
+    '''
+    plot several channels of an already loaded workspace at its current parameter point
+
+    :param ws: a HistFactory workspace
+    :param plots: list of (channel, observable, components) tuples, components being None for all samples
+    :param output: output file name pattern with {channel} and {observable} placeholders, or a single
+                   .pdf file name (without placeholders) to write all plots as pages of one document
+    :param jobs: number of worker processes used for rendering (separate output files only)
+    :param fitresult: a RooFitResult to draw post-fit uncertainty bands from
+    :param nsamples: number of covariance samples for the bands (None for linear propagation)
+    :return: list of written files
+    '''
+    multipage,tasks = _plot_tasks(ws,plots,output,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult,nsamples)
+    if multipage:
+        c = _canvas(dimensions)
+        c.Print('{}['.format(output))
+        drawn = []
+        for weighted_hists,components,_,style in tasks:
+            drawn += [draw(c,weighted_hists,components,style['title'],style['xaxis'],style['yaxis'],style['singlebin'],style['logy'])]
+            with profiling.span('canvas_save'):
+                c.Print(output)
+        c.Print('{}]'.format(output))
+        del drawn
+        return [output]
+
+    return _render_all(_render,tasks,jobs)
@@ -0,0 +1,125 @@
+from . import extract_hists, _palette, _plot_tasks, _render_all
+from .. import utils as hfutils
+from ..lazy import lazy_import
+from .. import profiling
+np = lazy_import('numpy')
+
+import logging
+log = logging.getLogger(__name__)
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def to_arrays(weighted_hists,components):
+    '''
+    convert the histograms returned by hftools.plotting.extract_hists into plain numpy arrays,
+    which can be rendered without ROOT (e.g. in worker processes)
+
+    :param weighted_hists: histograms as returned by extract_hists
+    :param components: a list of components
+    :return: dictionary with the bin edges, the data counts and errors, the component contents and optionally the band
+    '''
+    datahist = weighted_hists['data']
+    data, data_errors = hfutils.histogram_arrays(datahist)
+    arrays = {
+        'edges': hfutils.histogram_edges(datahist),
+        'data': data,
+        'data_errors': data_errors,
+        'model': [(c,hfutils.histogram_arrays(weighted_hists['model'][c])[0]) for c in components],
+    }
+    if 'band' in weighted_hists:
+        arrays['band'] = [hfutils.histogram_arrays(h)[0] for h in weighted_hists['band']]
+    return arrays
+
+@profiling.timed('draw')
+def draw(ax,arrays,title,xaxis,yaxis,singlebin,logy):
+    '''
+    draw a stacked plot of the components together with the data into matplotlib axes
+
+    :param ax: the matplotlib axes to draw into
+    :param arrays: arrays as returned by to_arrays
+    '''
+    edges = arrays['edges']
+    lo, widths = edges[:-1], np.diff(edges)
+    centers = lo + widths/2.0
+
+    bottom = np.zeros(len(lo))
+    colors = _palette(len(arrays['model']))
+    handles = []
+    for i,(component,contents) in enumerate(arrays['model']):
+        bars = ax.bar(lo,contents,widths,bottom = bottom,align = 'edge',color = colors[i % len(colors)],
+                      edgecolor = 'black',linewidth = 0.5,label = component)
+        handles += [bars]
+        bottom = bottom + contents
+
+    if 'band' in arrays:
+        nominal,up,down = arrays['band']
+        handles += [ax.bar(lo,up-down,widths,bottom = down,align = 'edge',fill = False,hatch = '////',
+                           linewidth = 0,label = 'post-fit unc.')]
+
+    handles += [ax.errorbar(centers,arrays['data'],yerr = arrays['data_errors'],fmt = 'o',color = 'black',
+                            markersize = 4,label = 'data')]
+
+    ax.set_xlim(edges[0],edges[-1])
+    if logy:
+        ax.set_yscale('log')
+    else:
+        ax.set_ylim(0,max(arrays['data'].max(),bottom.max())*1.5 or 1)
+    ax.set_title(title or '')
+    ax.set_ylabel(yaxis or '')
+    if singlebin:
+        ax.set_xticks(centers[:1])
+        ax.set_xticklabels([xaxis or ''])
+    else:
+        ax.set_xlabel(xaxis or '')
+    ax.legend(handles[::-1],[h.get_label() for h in handles[::-1]],frameon = False,fontsize = 'small')
+
+def _figure(plt,dimensions):
+    width,height = map(int,dimensions.split('x'))
+    return plt.figure(figsize = (width/100.0,height/100.0),dpi = 100)
+
+def _render(task):
+    arrays,filename,style = task
+    plt = _pyplot()
+    fig = _figure(plt,style['dimensions'])
+    draw(fig.gca(),arrays,style['title'],style['xaxis'],style['yaxis'],style['singlebin'],style['logy'])
+    with profiling.span('canvas_save'):
+        fig.savefig(filename)
+    plt.close(fig)
+    return filename
+
+def quickplot(ws,channel,obs,components,filename,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult = None,nsamples = None):
+    '''
+    matplotlib version of hftools.plotting.quickplot
+    '''
+    arrays = to_arrays(extract_hists(ws,channel,obs,components,fitresult,nsamples),components)
+    style = {'title': title, 'xaxis': xaxis, 'yaxis': yaxis, 'singlebin': singlebin, 'dimensions': dimensions, 'logy': logy}
+    _render((arrays,filename,style))
+
+def quickplot_many(ws,plots,output,title = None,xaxis = None,yaxis = None,singlebin = False,dimensions = '600x600',logy = False,jobs = 1,
+                   fitresult = None,nsamples = None):
+    '''
+    matplotlib version of hftools.plotting.quickplot_many. Only the extraction uses ROOT, the
+    rendering works on numpy arrays and is spread over a process pool.
+
+    :return: list of written files
+    '''
+    multipage,tasks = _plot_tasks(ws,plots,output,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult,nsamples)
+    tasks = [(to_arrays(weighted_hists,components),filename,style) for weighted_hists,components,filename,style in tasks]
+
+    if multipage:
+        plt = _pyplot()
+        from matplotlib.backends.backend_pdf import PdfPages
+        with PdfPages(output) as pdf:
+            for arrays,_,style in tasks:
+                fig = _figure(plt,style['dimensions'])
+                draw(fig.gca(),arrays,style['title'],style['xaxis'],style['yaxis'],style['singlebin'],style['logy'])
+                with profiling.span('canvas_save'):
+                    pdf.savefig(fig)
+                plt.close(fig)
+        return [output]
+
+    return _render_all(_render,tasks,jobs)
@@ -1,30 +1,62 @@
 #!/usr/bin/env python
 
-import ROOT
-ROOT.gROOT.SetBatch(True)
 import yaml
 import click
 import os
+from ..lazy import lazy_import, on_import
 from ..utils.parsexml import parse
 from .. import fitting as hffit
+from ..fitting import scan as hfscan
+from ..fitting import impacts as hfimpacts
+from ..fitting import toys as hftoys
 from .. import plotting as hfplot
 from .. import utils as hfutils
+from .. import profiling
+from ..utils.diskcache import HistogramCache
 
 import logging
 log = logging.getLogger(__name__)
 
+ROOT = lazy_import('ROOT')
+on_import('ROOT',lambda root: root.gROOT.SetBatch(True))
+
 
 logging.basicConfig()
 
+def open_rootfile(filename):
+    with profiling.span('file_open'):
+        return ROOT.TFile.Open(filename)
+
 def get_workspace(rootfile,workspace):
     click.secho('getting workspace',fg = 'green')
-    ws = rootfile.Get(str(workspace))
+    with profiling.span('workspace_load'):
+        ws = rootfile.Get(str(workspace))
     if not ws:
         raise click.ClickException('Could not find workspace in file')
     return ws
 
 
 
+def get_fitresult(identifier):
+    filename,path = identifier.split(':',1) if ':' in identifier else (identifier,'fitresult')
+    rootfile = open_rootfile(filename)
+    if not rootfile:
+        raise click.ClickException('Could not open file {}'.format(filename))
+    obj = rootfile.Get(path)
+    if not obj:
+        raise click.ClickException('Could not find {} in file {}'.format(path,filename))
+    return obj
+
+
+
+def get_backend(name):
+    if name == 'matplotlib':
+        from ..plotting import mpl
+        return mpl
+    return hfplot
+
+
+
 def save_pars(ws,output,justvalues = False):
     mc = ws.obj('ModelConfig')
 
@@ -52,8 +84,19 @@ def save_pars(ws,output,justvalues = False):
         results.write(yaml.dump(parpoint,default_flow_style = False))
 
 @click.group()
-def toplevel():
-    pass
+@click.option('--profile',default = None, help = 'write a per-stage timing breakdown to this JSON file')
+@click.option('--cprofile',default = None, help = 'write a cProfile dump to this file')
+@click.pass_context
+def toplevel(ctx,profile,cprofile):
+    if not (profile or cprofile):
+        return
+    session = profiling.Session(profile,cprofile).start()
+    def finish():
+        session.stop()
+        if profile:
+            for line in profiling.summary():
+                click.secho(line,err = True)
+    ctx.call_on_close(finish)
 
 @toplevel.command()
 @click.argument('toplvlxml')
@@ -78,16 +121,93 @@ def dump_information(toplvlxml,output):
 @click.option('-y','--yaxis',default = None)
 @click.option('--singlebin/--no-single-bin',default = False)
 @click.option('-d','--dimensions',default = '600x600')
-def plot_channel(rootfile,workspace,channel,observable,components,parpointfile,output,title,xaxis,yaxis,singlebin,dimensions,logy):
-    f = ROOT.TFile.Open(rootfile)
+@click.option('--cache-dir',default = None, help = 'cache extracted histograms in this directory')
+@click.option('--cache-size',default = 512, help = 'maximum size of the histogram cache in MB')
+@click.option('--fitresult',default = None, help = 'file.root:name of a RooFitResult to draw the post-fit uncertainty band from')
+@click.option('--samples',default = None, type = int, help = 'number of covariance samples for the band (default: linear propagation)')
+@click.option('--backend',default = 'root', type = click.Choice(['root','matplotlib']), help = 'rendering backend')
+def plot_channel(rootfile,workspace,channel,observable,components,parpointfile,output,title,xaxis,yaxis,singlebin,dimensions,logy,cache_dir,cache_size,fitresult,samples,backend):
+    f = open_rootfile(rootfile)
+    ws = get_workspace(f,workspace)
+    if cache_dir:
+        hfutils.use_histogram_cache(ws,HistogramCache(cache_dir,rootfile,cache_size << 20))
+
+    parpoint_data = yaml.load(open(parpointfile))
+
+    hfutils.set_pars2(ws,parpoint_data)
+    complist = hfutils.samples(ws,channel) if components == 'all' else components.split(',')
+    fitresult = get_fitresult(fitresult) if fitresult else None
+    get_backend(backend).quickplot(ws,channel,observable,complist,output,title,xaxis,yaxis,singlebin,dimensions,logy,fitresult,samples)
+
+
+@toplevel.command()
+@click.argument('rootfile')
+@click.argument('workspace')
+@click.argument('parpointfile')
+@click.option('--channels',default = 'all', help = 'comma separated list of channels')
+@click.option('--observable',default = 'x')
+@click.option('--logy/--no-logy',default = False)
+@click.option('-o','--output',default = '{channel}.pdf', help = 'file name pattern using {channel} and {observable} or a single multi-page .pdf file')
+@click.option('-t','--title',default = None)
+@click.option('-x','--xaxis',default = None)
+@click.option('-y','--yaxis',default = None)
+@click.option('--singlebin/--no-single-bin',default = False)
+@click.option('-d','--dimensions',default = '600x600')
+@click.option('-j','--jobs',default = 1, help = 'number of worker processes used for rendering')
+@click.option('--cache-dir',default = None, help = 'cache extracted histograms in this directory')
+@click.option('--cache-size',default = 512, help = 'maximum size of the histogram cache in MB')
+@click.option('--fitresult',default = None, help = 'file.root:name of a RooFitResult to draw the post-fit uncertainty band from')
+@click.option('--samples',default = None, type = int, help = 'number of covariance samples for the band (default: linear propagation)')
+@click.option('--backend',default = 'root', type = click.Choice(['root','matplotlib']), help = 'rendering backend')
+def plot_all(rootfile,workspace,parpointfile,channels,observable,output,title,xaxis,yaxis,singlebin,dimensions,logy,jobs,cache_dir,cache_size,fitresult,samples,backend):
+    f = open_rootfile(rootfile)
     ws = get_workspace(f,workspace)
+    if cache_dir:
+        hfutils.use_histogram_cache(ws,HistogramCache(cache_dir,rootfile,cache_size << 20))
 
     parpoint_data = yaml.load(open(parpointfile))
 
     hfutils.set_pars2(ws,parpoint_data)
+    channellist = hfutils.channels(ws) if channels == 'all' else channels.split(',')
+    fitresult = get_fitresult(fitresult) if fitresult else None
+    try:
+        written = get_backend(backend).quickplot_many(ws,[(channel,observable,None) for channel in channellist],output,
+                                        title,xaxis,yaxis,singlebin,dimensions,logy,jobs,fitresult,samples)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for filename in written:
+        click.secho('wrote {}'.format(filename),fg = 'green')
+
+
+@toplevel.command()
+@click.argument('rootfile')
+@click.argument('workspace')
+@click.argument('channel')
+@click.argument('observable')
+@click.argument('parpointfiles',nargs = -1,required = True)
+@click.option('--logy/--no-logy',default = False)
+@click.option('-c','--components',default = 'all')
+@click.option('-o','--output',default = '{label}', help = 'output file name pattern (without extension) using {label}, the parameter point file name')
+@click.option('-f','--formats',default = 'pdf', help = 'comma separated list of output formats, e.g. pdf,png,C')
+@click.option('-t','--title',default = None, help = 'plot title, may use {label}')
+@click.option('-x','--xaxis',default = None)
+@click.option('-y','--yaxis',default = None)
+@click.option('--singlebin/--no-single-bin',default = False)
+@click.option('-d','--dimensions',default = '600x600')
+@click.option('--cache-dir',default = None, help = 'cache extracted histograms in this directory')
+@click.option('--cache-size',default = 512, help = 'maximum size of the histogram cache in MB')
+def plot_points(rootfile,workspace,channel,observable,parpointfiles,components,output,formats,title,xaxis,yaxis,singlebin,dimensions,logy,cache_dir,cache_size):
+    f = open_rootfile(rootfile)
+    ws = get_workspace(f,workspace)
+    if cache_dir:
+        hfutils.use_histogram_cache(ws,HistogramCache(cache_dir,rootfile,cache_size << 20))
+
+    parpoints = [(os.path.splitext(os.path.basename(filename))[0],yaml.load(open(filename))) for filename in parpointfiles]
     complist = hfutils.samples(ws,channel) if components == 'all' else components.split(',')
-    print hfplot
-    hfplot.quickplot(ws,channel,observable,complist,output,title,xaxis,yaxis,singlebin,dimensions,logy)
+    written = hfplot.quickplot_points(ws,channel,observable,complist,parpoints,output,formats.split(','),
+                                      title,xaxis,yaxis,singlebin,dimensions,logy)
+    for filename in written:
+        click.secho('wrote {}'.format(filename),fg = 'green')
 
 
 @toplevel.command()
@@ -95,22 +215,160 @@ def plot_channel(rootfile,workspace,channel,observable,components,parpointfile,o
 @click.argument('workspace')
 @click.argument('output')
 def write_vardef(rootfile,workspace,output):
-  f = ROOT.TFile.Open(rootfile)
+  f = open_rootfile(rootfile)
   ws = get_workspace(f,workspace)
   save_pars(ws,output)
 
 
+def fit_options(func):
+    '''
+    decorator adding the options of hftools.fitting.FitOptions to a command
+    '''
+    options = [
+        click.option('--cpus',default = 1, help = 'number of processes evaluating the likelihood in parallel'),
+        click.option('--minimizer',default = 'Minuit2'),
+        click.option('--algorithm',default = 'Migrad'),
+        click.option('--strategy',default = 1, help = 'minimizer strategy (0-2)'),
+        click.option('--tolerance',default = None, type = float, help = 'minimizer tolerance'),
+        click.option('--optimize',default = 2, help = 'constant term optimization level (0-2)'),
+        click.option('--hesse/--no-hesse',default = True),
+        click.option('--minos',default = None, help = 'comma separated list of parameters to run Minos on'),
+        click.option('--offset/--no-offset',default = True),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def make_fit_options(cpus,minimizer,algorithm,strategy,tolerance,optimize,hesse,minos,offset):
+    return hffit.FitOptions(cpus = cpus, optimize_const = optimize, minimizer = minimizer, algorithm = algorithm,
+                            strategy = strategy, tolerance = tolerance, hesse = hesse,
+                            minos = minos.split(',') if minos else None, offset = offset)
+
+def report_fit(result,summaryfile = None):
+    summary = result.summary()
+    color = 'green' if summary['status'] == 0 else 'red'
+    click.secho('fit status {status}, EDM {edm:.3g}, NLL {nll:.6f}, {ncalls} calls in {seconds:.1f}s'.format(**summary),fg = color)
+    for stage in summary['stages']:
+        click.secho('  {stage:<8} status {status:>2} {ncalls:>8} calls {seconds:>9.2f}s'.format(**stage))
+    if summaryfile:
+        with open(summaryfile,'w') as f:
+            f.write(yaml.safe_dump(summary,default_flow_style = False))
+
 @toplevel.command()
 @click.argument('rootfile')
 @click.argument('workspace')
 @click.argument('output')
-def fit(rootfile,workspace,output):
-    f = ROOT.TFile.Open(rootfile)
+@fit_options
+@click.option('--summary',default = None, help = 'write status, EDM, calls and wall time per fit stage to this YAML file')
+@click.option('--init-pars',default = None, help = 'parameter point (save_pars format) to start the fit from')
+@click.option('--init-covariance',default = None, help = 'file.root:name of a RooFitResult whose covariance seeds the step sizes')
+@click.option('--save-fitresult',default = None, help = 'write the RooFitResult (as "fitresult") to this ROOT file')
+@click.option('--compare-cold/--no-compare-cold',default = False, help = 'also run a fit from the stored values to report the calls saved by the warm start')
+def fit(rootfile,workspace,output,summary,init_pars,init_covariance,save_fitresult,compare_cold,**fitargs):
+    f = open_rootfile(rootfile)
     ws = get_workspace(f,workspace)
-    result = hffit.fit(ws)
+    options = make_fit_options(**fitargs)
+
+    initial_fitresult = get_fitresult(init_covariance) if init_covariance else None
+    warm = bool(init_pars or initial_fitresult)
+
+    cold_result = None
+    if warm and compare_cold:
+        click.secho('running reference fit from stored values',fg = 'green')
+        # snapshots only hold values, the errors (initial step sizes) are restored separately
+        ws.saveSnapshot('hftools_cold_start',ws.allVars())
+        errors = [(v,v.getError()) for v in hfutils.iterate(ws.allVars())]
+        cold_result = hffit.fit(ws,options)
+        ws.loadSnapshot('hftools_cold_start')
+        for v,error in errors:
+            v.setError(error)
+
+    if init_pars:
+        seeded = hffit.seed_parameters(ws,yaml.load(open(init_pars)))
+        click.secho('seeded {} parameters from {}'.format(len(seeded),init_pars),fg = 'green')
+
+    result = hffit.fit(ws,options,initial_fitresult = initial_fitresult)
     assert result
+    report_fit(result,summary)
+    if cold_result:
+        # only the minimization profits from the warm start, Hesse and Minos cost the same
+        stage = options.algorithm.lower()
+        warm_calls,cold_calls = result.stage_calls(stage),cold_result.stage_calls(stage)
+        click.secho('{} calls with warm start: {}, cold start: {}, saved {} calls ({:.1f}x)'.format(
+            options.algorithm,warm_calls,cold_calls,cold_calls-warm_calls,float(cold_calls)/max(warm_calls,1)),fg = 'green')
+    elif warm:
+        click.secho('warm start: {} calls'.format(result.ncalls),fg = 'green')
+
+    if save_fitresult:
+        outfile = ROOT.TFile.Open(save_fitresult,'RECREATE')
+        result.roofit.Write('fitresult')
+        outfile.Close()
     save_pars(ws,output,False)
 
 
+@toplevel.command()
+@click.argument('rootfile')
+@click.argument('workspace')
+@click.argument('parameter')
+@click.argument('output')
+@click.option('--min','low',default = 0.0, help = 'lower end of the scan range')
+@click.option('--max','high',default = 2.0, help = 'upper end of the scan range')
+@click.option('-n','--points',default = 21, help = 'number of scan points')
+@click.option('-j','--jobs',default = 1, help = 'number of worker processes')
+@fit_options
+def scan(rootfile,workspace,parameter,output,low,high,points,jobs,**fitargs):
+    values = [low + (high-low)*i/float(max(points-1,1)) for i in range(points)]
+    def report(record):
+        if 'error' in record:
+            click.secho('{} = {}: failed: {}'.format(parameter,record.get('value'),record['error']),fg = 'red')
+        else:
+            click.secho('{parameter} = {value:.6g}: NLL {nll:.6f} (status {status}, {ncalls} calls)'.format(**record))
+    records = hfscan.scan(rootfile,workspace,parameter,values,output,jobs,make_fit_options(**fitargs),report)
+    if records:
+        best = min(records,key = lambda r: r['nll'])
+        click.secho('{} of {} points done, minimum NLL at {} = {:.6g}'.format(len(records),points,parameter,best['value']),fg = 'green')
+
+
+@toplevel.command()
+@click.argument('rootfile')
+@click.argument('workspace')
+@click.argument('output')
+@click.option('--checkpoint',default = None, help = 'checkpoint file to resume from (default: <output>.checkpoint)')
+@click.option('--parameters',default = None, help = 'comma separated list of nuisance parameters (default: all)')
+@click.option('-j','--jobs',default = 1, help = 'number of worker processes')
+@fit_options
+def impacts(rootfile,workspace,output,checkpoint,parameters,jobs,**fitargs):
+    def report(record):
+        if 'error' in record:
+            click.secho('{}: failed: {}'.format(record.get('parameter','?'),record['error']),fg = 'red')
+        else:
+            click.secho('{parameter}: POI {poi_down:.6g} / {poi_up:.6g}'.format(**record))
+    try:
+        ranked = hfimpacts.impacts(rootfile,workspace,checkpoint or '{}.checkpoint'.format(output),jobs,
+                                   make_fit_options(**fitargs),parameters.split(',') if parameters else None,report)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    hfimpacts.save_impacts(ranked,output)
+    click.secho('wrote impacts of {} parameters to {}'.format(len(ranked),output),fg = 'green')
+
+
+@toplevel.command()
+@click.argument('rootfile')
+@click.argument('workspace')
+@click.argument('outputdir')
+@click.option('-n','--ntoys',default = 1000, help = 'number of toys')
+@click.option('--batch-size',default = 100, help = 'number of toys per batch (and output shard)')
+@click.option('--seed',default = 1234, help = 'base random seed, toy i uses seed+i')
+@click.option('--parpoint',default = None, help = 'parameter point (save_pars format) to generate the toys at')
+@click.option('-j','--jobs',default = 1, help = 'number of worker processes')
+@fit_options
+def toys(rootfile,workspace,outputdir,ntoys,batch_size,seed,parpoint,jobs,**fitargs):
+    def report(start,stop):
+        click.secho('toys {}-{} done'.format(start,stop-1))
+    parpoint_data = yaml.load(open(parpoint)) if parpoint else None
+    shards = hftoys.toys(rootfile,workspace,outputdir,ntoys,batch_size,seed,jobs,make_fit_options(**fitargs),parpoint_data,report)
+    click.secho('{} toy batches in {}'.format(len(shards),outputdir),fg = 'green')
+
+
 if __name__=='__main__':
   toplevel()
@@ -0,0 +1,146 @@
+'''
+process pool that does not hang when a worker dies. A plain multiprocessing.Pool waits forever
+for the result of a task whose worker segfaulted or was killed, which happens with PyROOT. Here
+workers announce every task they start through a manager queue, so the main process knows which
+task a dead worker was running.
+'''
+import os
+import traceback
+import functools
+import multiprocessing
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+import logging
+log = logging.getLogger(__name__)
+
+# queue of the current worker process (or a direct dispatcher when running in the main process)
+_state = {'queue': None}
+
+class _DirectQueue(object):
+    def __init__(self,callback):
+        self.put = callback
+
+def emit(record):
+    '''
+    send an intermediate record from a running task to the main process
+    '''
+    _state['queue'].put(('record',None,record))
+
+def _init_process(queue,initializer,initargs):
+    _state['queue'] = queue
+    if initializer is None:
+        return
+    try:
+        initializer(*initargs)
+    except Exception:
+        # the pool would keep replacing the failing worker, tell the main process to give up
+        queue.put(('init_failed',None,traceback.format_exc()))
+        raise
+
+def _run_task(func,indexed_task):
+    index,task = indexed_task
+    queue = _state['queue']
+    queue.put(('started',index,os.getpid()))
+    try:
+        result = func(task)
+    except Exception:
+        queue.put(('failed',index,traceback.format_exc()))
+        return
+    queue.put(('done',index,result))
+
+def _alive(pid):
+    try:
+        os.kill(pid,0)
+    except OSError:
+        return False
+    return True
+
+def run(func,tasks,jobs,on_result = None,on_record = None,on_lost = None,initializer = None,initargs = ()):
+    '''
+    run func(task) for all tasks in jobs worker processes. Results and records are passed to the
+    callbacks in the main process as soon as they arrive.
+
+    :param func: picklable function taking a task
+    :param tasks: list of (picklable) tasks
+    :param jobs: number of worker processes (1 runs the tasks in the current process)
+    :param on_result: callback taking the task index and the return value of func
+    :param on_record: callback for records sent by the tasks with emit(record)
+    :param on_lost: callback taking the task index if a worker dies while running that task. The
+                    remaining tasks continue in a new worker. Without it a dead worker raises.
+    :param initializer: function run once in every worker process
+    :param initargs: arguments of the initializer
+    :raises RuntimeError: if a task fails, a worker fails to initialize or dies (without on_lost)
+    '''
+    def handle(message):
+        kind,index,value = message
+        if kind == 'init_failed':
+            raise RuntimeError('worker initialization failed:\n{}'.format(value))
+        if kind == 'failed':
+            raise RuntimeError('task {} failed:\n{}'.format(index,value))
+        if kind == 'record' and on_record:
+            on_record(value)
+        if kind == 'done' and on_result:
+            on_result(index,value)
+
+    if jobs <= 1:
+        _state['queue'] = _DirectQueue(handle)
+        try:
+            if initializer is not None:
+                initializer(*initargs)
+            for index,task in enumerate(tasks):
+                result = func(task)
+                if on_result:
+                    on_result(index,result)
+        finally:
+            _state['queue'] = None
+        return
+
+    # a manager queue delivers every message synchronously, so the start of a task is known
+    # to the main process even if the worker dies right after
+    manager = multiprocessing.Manager()
+    queue = manager.Queue()
+    pool = multiprocessing.Pool(jobs,_init_process,(queue,initializer,initargs))
+    lost = False
+    try:
+        pending = pool.map_async(functools.partial(_run_task,func),list(enumerate(tasks)),chunksize = 1)
+        finished = 0
+        running = {}
+        while finished < len(tasks):
+            try:
+                message = queue.get(timeout = 1)
+            except Empty:
+                if pending.ready() and not pending.successful():
+                    pending.get()
+                for index,pid in list(running.items()):
+                    if _alive(pid):
+                        continue
+                    if on_lost is None:
+                        raise RuntimeError('worker process {} died while running task {}'.format(pid,index))
+                    log.error('worker process %s died while running task %s',pid,index)
+                    del running[index]
+                    finished += 1
+                    lost = True
+                    on_lost(index)
+                continue
+            kind,index,value = message
+            if kind == 'started':
+                running[index] = value
+            elif kind in ['done','failed']:
+                running.pop(index,None)
+                finished += 1
+            handle(message)
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
+        raise
+    if lost:
+        # the pool still waits for the results of the lost tasks
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
+    manager.shutdown()
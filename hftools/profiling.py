@@ -0,0 +1,172 @@
+'''
+lightweight instrumentation: named timing spans and counters around the hot paths of hftools.
+Everything is a no-op until enable() is called, e.g. through the --profile option of the command
+line tools, which write the per-stage breakdown as JSON.
+'''
+import time
+import json
+import functools
+import collections
+
+_state = {
+    'enabled': False,
+    'spans': collections.defaultdict(lambda: [0,0.0,0.0,0.0]),
+    'counters': collections.Counter(),
+    'stack': [],
+    'start': None,
+}
+
+def enable():
+    _state['enabled'] = True
+    if _state['start'] is None:
+        _state['start'] = time.time()
+
+def disable():
+    _state['enabled'] = False
+
+def enabled():
+    return _state['enabled']
+
+def reset():
+    _state['spans'].clear()
+    _state['counters'].clear()
+    del _state['stack'][:]
+    _state['start'] = time.time() if _state['enabled'] else None
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+_null_span = _NullSpan()
+
+class _Span(object):
+    def __init__(self,name):
+        self.name = name
+        self.children = 0.0
+
+    def __enter__(self):
+        _state['stack'].append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self,*exc):
+        elapsed = time.time() - self.start
+        stack = _state['stack']
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        entry = _state['spans'][self.name]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - self.children
+        entry[3] = max(entry[3],elapsed)
+        return False
+
+def span(name):
+    '''
+    context manager timing a named stage. Nested spans are subtracted from the self time of the
+    enclosing one.
+
+    :param name: name of the stage
+    '''
+    if not _state['enabled']:
+        return _null_span
+    return _Span(name)
+
+def timed(name):
+    '''
+    decorator timing every call of a function as a span
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if not _state['enabled']:
+                return func(*args,**kwargs)
+            with _Span(name):
+                return func(*args,**kwargs)
+        return wrapper
+    return decorator
+
+def count(name,n = 1):
+    '''
+    increase a named counter (e.g. number of histograms built)
+    '''
+    if _state['enabled']:
+        _state['counters'][name] += n
+
+def report():
+    '''
+    :return: dictionary with the wall time since enabling, the per-stage timings (sorted by
+             total time) and the counters
+    '''
+    spans = collections.OrderedDict()
+    for name,(calls,total,own,longest) in sorted(_state['spans'].items(),key = lambda item: -item[1][1]):
+        spans[name] = {'calls': calls, 'total': total, 'self': own, 'mean': total/calls if calls else 0.0, 'max': longest}
+    return {
+        'wall': time.time() - _state['start'] if _state['start'] is not None else 0.0,
+        'spans': spans,
+        'counters': dict(_state['counters']),
+    }
+
+def merge(other):
+    '''
+    add a report of another process (e.g. a worker) to the current measurements
+    '''
+    for name,entry in other['spans'].items():
+        mine = _state['spans'][name]
+        mine[0] += entry['calls']
+        mine[1] += entry['total']
+        mine[2] += entry['self']
+        mine[3] = max(mine[3],entry['max'])
+    _state['counters'].update(other['counters'])
+
+def write(filename):
+    with open(filename,'w') as f:
+        json.dump(report(),f,indent = 2)
+
+def summary(limit = 15):
+    '''
+    :return: list of text lines with the most expensive stages and the counters
+    '''
+    result = report()
+    lines = ['{:<30} {:>8} {:>10} {:>10}'.format('stage','calls','total [s]','self [s]')]
+    for name,entry in list(result['spans'].items())[:limit]:
+        lines += ['{:<30} {:>8} {:>10.3f} {:>10.3f}'.format(name,entry['calls'],entry['total'],entry['self'])]
+    lines += ['{:<30} {:>8}'.format(name,value) for name,value in sorted(result['counters'].items())]
+    lines += ['wall time {:.3f}s'.format(result['wall'])]
+    return lines
+
+class Session(object):
+    '''
+    profile a command: enables the spans and counters and optionally cProfile, and writes the
+    results when finished
+
+    :param output: JSON file for the per-stage breakdown (None to not enable the spans)
+    :param cprofile: file for a cProfile dump (None to not run cProfile)
+    '''
+    def __init__(self,output = None,cprofile = None):
+        self.output = output
+        self.cprofile = cprofile
+        self.profiler = None
+
+    def start(self):
+        if self.output:
+            enable()
+            reset()
+        if self.cprofile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.cprofile)
+            self.profiler = None
+        if self.output:
+            write(self.output)
+            disable()
@@ -1,6 +1,10 @@
-import ROOT
-import math
+import contextlib
+import collections
 import logging
+from ..lazy import lazy_import
+from .. import profiling
+ROOT = lazy_import('ROOT')
+np = lazy_import('numpy')
 log = logging.getLogger(__name__)
 
 ### Naming Conventions
@@ -32,19 +36,43 @@ def shapePoissonVarNames(sysname,binnr):
     tau   =  'gamma_{}_bin_{}_tau'.format(sysname,binnr)
     return gamma,tau
 
+def componentFuncMarker(channel):
+    return '_{}_overallSyst'.format(channel)
+
 def isComponentFunc(channel,name,component = None):
     if component:
-        return 'L_x_{}_{}'.format(component,channel) in name
+        return 'L_x_{}{}'.format(component,componentFuncMarker(channel)) in name
     else:
-        return name.startswith('L_x') and name.split('_')[3] == channel
+        return name.startswith('L_x_') and componentFuncMarker(channel) in name
+
+def splitComponentFunc(name,channels):
+    '''
+    split the name of a component function (L_x_{sample}_{channel}_overallSyst_x_...) into
+    sample and channel. Matching against the known channel names keeps names with
+    underscores intact.
+
+    :param name: a function name
+    :param channels: list of channel names
+    :return: tuple of sample and channel name or None if it is not a component function
+    '''
+    if not name.startswith('L_x_'):
+        return None
+    for channel in sorted(channels,key = len,reverse = True):
+        pos = name.find(componentFuncMarker(channel),len('L_x_'))
+        if pos > len('L_x_'):
+            return name[len('L_x_'):pos],channel
+    return None
 
 ### End Naming Conventions
 
+@profiling.timed('set_pars')
 def set_pars(ws,parpoint,reference_snapshot):
+    profiling.count('snapshot_loads')
     ws.loadSnapshot(reference_snapshot)
     for name,val in parpoint.iteritems():
         ws.var(name).setVal(val)
 
+@profiling.timed('set_pars')
 def set_pars2(ws,parpoint_data):
     for name,value_data in parpoint_data.iteritems():
         try:
@@ -52,30 +80,141 @@ def set_pars2(ws,parpoint_data):
         except:
             log.exception('could not get variable %s',)
 
+### Per-Workspace Caches
+
+_workspace_caches = {'workspace':None,'entries':{}}
+
+def workspace_cache(ws):
+    '''
+    dictionary of derived lookup structures for a workspace. The cache is dropped
+    as soon as a different workspace object is passed in.
+
+    :param ws: a HistFactory workspace object
+    :return: the cache dictionary for this workspace
+    '''
+    if _workspace_caches['workspace'] is not ws:
+        _workspace_caches['workspace'] = ws
+        _workspace_caches['entries'] = {}
+    return _workspace_caches['entries']
+
+def invalidate_cache():
+    _workspace_caches['workspace'] = None
+    _workspace_caches['entries'] = {}
+
+ComponentEntry = collections.namedtuple('ComponentEntry',['function','binwidth','observable'])
+
+def _component_functions(ws):
+    cache = workspace_cache(ws)
+    if 'component_functions' in cache:
+        return cache['component_functions']
+
+    allchannels = channels(ws)
+    index = {}
+    for v in iterate(ws.allFunctions()):
+        split = splitComponentFunc(v.GetName(),allchannels)
+        if split:
+            sample,channel = split
+            index.setdefault(channel,[]).append((sample,v))
+    cache['component_functions'] = index
+    return index
+
+def component_index(ws,channel,obs):
+    '''
+    ordered index of the model components of a channel, built from a single scan
+    over the workspace functions.
+
+    :param ws: a HistFactory workspace object
+    :param channel: a channel name
+    :param obs: an observable name
+    :return: ordered dictionary of sample name to ComponentEntry
+    '''
+    cache = workspace_cache(ws).setdefault('component_index',{})
+    if (channel,obs) in cache:
+        return cache[(channel,obs)]
+
+    observable = ws.var(obsname(obs,channel))
+    entries = collections.OrderedDict()
+    for i,(sample,func) in enumerate(_component_functions(ws).get(channel,[])):
+        if sample not in entries:
+            entries[sample] = ComponentEntry(func,ws.var(binwidthname(obs,channel,i)),observable)
+    cache[(channel,obs)] = entries
+    return entries
+
+### End Per-Workspace Caches
+
+def category_labels(category):
+    '''
+    :param category: a RooFit category (e.g. the channelCat of a workspace)
+    :return: list of the state labels of the category
+    '''
+    current = category.getIndex()
+    labels = []
+    for i in range(category.numTypes()):
+        category.setBin(i)
+        labels += [category.getLabel()]
+    category.setIndex(current)
+    return labels
+
+def channels(ws):
+    cache = workspace_cache(ws)
+    if 'channels' not in cache:
+        cache['channels'] = sorted(category_labels(ws.cat('channelCat')))
+    return cache['channels']
+
 def samples(ws,channel):
-    allfuncs = ws.allFunctions()
-    it = allfuncs.iterator()
-    v = it.Next()
-    samples = []
-    while v:
-        name =  v.GetName()
-        if isComponentFunc(channel,name):
-            samples += [name.split('_')[2]]
-        v = it.Next()
-    return samples
+    return [sample for sample,func in _component_functions(ws).get(channel,[])]
 
 def binwidth(ws,obs,channel,component):
-    for i,s in enumerate(samples(ws,channel)):
-        if s==component:
-            return ws.var(binwidthname(obs,channel,i)).getVal()
+    entry = component_index(ws,channel,obs).get(component)
+    if entry:
+        return entry.binwidth.getVal()
+
+def use_histogram_cache(ws,cache):
+    '''
+    enable an on-disk cache for histograms extracted from a workspace
+
+    :param ws: a HistFactory workspace object
+    :param cache: a hftools.utils.diskcache.HistogramCache object (None to disable)
+    '''
+    workspace_cache(ws)['histogram_cache'] = cache
+
+def _extraction_parameters(ws,channel,obs,component,func):
+    cache = workspace_cache(ws).setdefault('extraction_parameters',{})
+    if (channel,obs,component) not in cache:
+        cache[(channel,obs,component)] = func.getParameters(ROOT.RooArgSet(ws.var(obsname(obs,channel))))
+    return cache[(channel,obs,component)]
+
+def _cached_extraction(ws,channel,obs,component,func,name,compute):
+    cache = workspace_cache(ws).get('histogram_cache')
+    if not cache:
+        return compute()
+    from . import diskcache
+    #only the parameters the extracted function depends on enter the key, their values are read on every call
+    parameters = _extraction_parameters(ws,channel,obs,component,func)
+    key = cache.key(ws.GetName(),channel,obs,component,diskcache.parameter_hash(diskcache.parameter_values(parameters)))
+    cached = cache.load(key)
+    if cached is not None:
+        profiling.count('histogram_cache_hits')
+        return diskcache.to_root(name,*cached)
+    profiling.count('histogram_cache_misses')
+    histo = compute()
+    cache.store(key,histogram_edges(histo),*histogram_arrays(histo))
+    return histo
 
 def extract_total(ws,channel,obs):
     oname=obsname(obs,channel)
     totalpdf = ws.pdf(totalpdfname(channel))
-    h = totalpdf.createHistogram(oname)
-    h.Scale(1./ws.var(binwidthname(obs,channel,0)).getVal())
-    return h
-
+    components = component_index(ws,channel,obs)
+    if not components:
+        raise ValueError('no model components found for channel {} (observable {})'.format(channel,obs))
+    def compute():
+        profiling.count('roofit_histograms')
+        h = totalpdf.createHistogram(oname)
+        h.Scale(1./list(components.values())[0].binwidth.getVal())
+        return h
+    return _cached_extraction(ws,channel,obs,None,totalpdf,'{}__{}'.format(totalpdf.GetName(),oname),compute)
+
+@profiling.timed('extract')
 def extract(ws,channel,obs,component = None):
     '''
     Extract model contribution in a given channel and for a given observable as a histogram. If no model component
@@ -91,28 +230,163 @@ def extract(ws,channel,obs,component = None):
         return extract_total(ws,channel,obs)
     oname=obsname(obs,channel)
 
-    allfuncs = ws.allFunctions()
-    it = allfuncs.iterator()
+    entry = component_index(ws,channel,obs)[component]
 
-    v = it.Next()
-    while v:
-        name =  v.GetName()
-        if isComponentFunc(channel,name,component):
-            break
-        v = it.Next()
-
-    histo = v.createHistogram(oname)
-    histo.SetDirectory(0)
-    histo.Scale(binwidth(ws,obs,channel,component))
-    return histo
+    def compute():
+        profiling.count('roofit_histograms')
+        histo = entry.function.createHistogram(oname)
+        histo.SetDirectory(0)
+        histo.Scale(entry.binwidth.getVal())
+        return histo
+    return _cached_extraction(ws,channel,obs,component,entry.function,'{}__{}'.format(entry.function.GetName(),oname),compute)
 
 def extract_with_pars(ws,channel,observable,component,pars,reference_snapshot = "NominalParamValues"):
     set_pars(ws,pars,reference_snapshot)
     return extract(ws,channel,observable,component)
 
+_buffer_dtypes = {'C':'i1','S':'i2','I':'i4','F':'f4','D':'f8'}
+
+def _read_buffer(buf,dtype,count):
+    try:
+        return np.frombuffer(buf,dtype = dtype,count = count).astype(float)
+    except (TypeError,ValueError):
+        return None
+
+def histogram_buffers(histo):
+    '''
+    read all cells (including under- and overflow) of a histogram into numpy arrays,
+    using the histogram's array buffers where possible instead of per-bin calls.
+
+    :param histo: a TH1/TH2/TH3 object
+    :return: tuple of contents and (symmetric) errors arrays, indexed by global bin number
+    '''
+    histo.BufferEmpty()
+    ncells = histo.GetNcells()
+    contents, errors = None, None
+    # the buffers of profiles hold sums, their contents and errors need the per-bin calls
+    profile = any(histo.InheritsFrom(cls) for cls in ['TProfile','TProfile2D','TProfile3D'])
+    dtype = _buffer_dtypes.get(histo.ClassName()[-1])
+    if dtype is not None and not profile:
+        contents = _read_buffer(histo.GetArray(),dtype,ncells)
+    if contents is None:
+        profiling.count('pyroot_bin_calls',ncells)
+        contents = np.fromiter((histo.GetBinContent(i) for i in range(ncells)),dtype = float, count = ncells)
+
+    if histo.GetBinErrorOption() == ROOT.TH1.kNormal and not profile:
+        if histo.GetSumw2N():
+            sumw2 = _read_buffer(histo.GetSumw2().GetArray(),'f8',ncells)
+            errors = np.sqrt(sumw2) if sumw2 is not None else None
+        else:
+            errors = np.sqrt(np.abs(contents))
+    if errors is None:
+        profiling.count('pyroot_bin_calls',ncells)
+        errors = np.fromiter((histo.GetBinError(i) for i in range(ncells)),dtype = float, count = ncells)
+    return contents,errors
+
+def histogram_arrays(histo):
+    '''
+    read the in-range bin contents and errors of a 1D histogram into numpy arrays
+
+    :param histo: a TH1 object
+    :return: tuple of contents and errors arrays
+    '''
+    contents,errors = histogram_buffers(histo)
+    inrange = slice(1,histo.GetNbinsX()+1)
+    return contents[inrange],errors[inrange]
+
+def histogram_edges(histo):
+    '''
+    :param histo: a TH1 object
+    :return: numpy array of the bin edges of the x axis
+    '''
+    axis = histo.GetXaxis()
+    nbins = histo.GetNbinsX()
+    xbins = axis.GetXbins()
+    if xbins.GetSize() == nbins+1:
+        return np.frombuffer(xbins.GetArray(),dtype = 'f8',count = nbins+1).copy()
+    return np.linspace(axis.GetXmin(),axis.GetXmax(),nbins+1)
+
+@profiling.timed('extract_variations')
+def extract_variations(ws,channel,observable,component,parsets,reference_snapshot = "NominalParamValues",as_arrays = False):
+    '''
+    Extract a model contribution for a batch of parameter points. The reference snapshot is loaded
+    once and the nominal is extracted once, after that only the parameters touched by each point are
+    changed and restored again.
+
+    :param ws: a HistFactory workspace object
+    :param channel: a channel name
+    :param observable: an observable name
+    :param component: a component name (None for the full pdf)
+    :param parsets: list of {parameter name: value} dictionaries
+    :param reference_snapshot: snapshot to start from (None to use the current parameter values)
+    :param as_arrays: return bin contents as numpy arrays instead of histograms
+    :return: tuple of the nominal and the list of variations (in the order of parsets)
+    '''
+    if reference_snapshot:
+        profiling.count('snapshot_loads')
+        ws.loadSnapshot(reference_snapshot)
+    profiling.count('parameter_points',len(parsets))
+
+    def evaluate():
+        histo = extract(ws,channel,observable,component)
+        return histogram_arrays(histo)[0] if as_arrays else histo
+
+    variables = {}
+    nominal = evaluate()
+    variations = []
+    for pardict in parsets:
+        touched = []
+        for name,val in pardict.iteritems():
+            if name not in variables:
+                variables[name] = ws.var(name)
+            var = variables[name]
+            touched += [(var,var.getVal())]
+            var.setVal(val)
+        variations += [evaluate()]
+        for var,previous in touched:
+            var.setVal(previous)
+    return nominal,variations
+
+def _split_data(ws):
+    cache = workspace_cache(ws)
+    if 'data_split' not in cache:
+        data = ws.data(dataName())
+        #single pass over the dataset for all channels
+        profiling.count('data_reductions')
+        with profiling.span('data_reduction'):
+            datalist = data.split(ws.cat('channelCat'))
+        it = datalist.MakeIterator()
+        d = it.Next()
+        split = {}
+        while d:
+            split[d.GetName()] = d
+            d = it.Next()
+        cache['data_split'] = split
+        cache['data_split_list'] = datalist
+    return cache['data_split']
+
+def _data_histogram(ws,channel,observable):
+    cache = workspace_cache(ws).setdefault('data_hists',{})
+    if (channel,observable) not in cache:
+        obsvar = ws.var(obsname(observable,channel))
+
+        varlist = ROOT.RooArgList()
+        varlist.add(obsvar)
+
+        datahist = obsvar.createHistogram('data_{}'.format(channel))
+        datahist.SetDirectory(0)
+        reduced = _split_data(ws).get(channel)
+        if reduced:
+            datahist = reduced.fillHistogram(datahist,varlist)
+        datahist.Sumw2(0)
+        cache[(channel,observable)] = datahist
+    return cache[(channel,observable)]
+
+@profiling.timed('extract_data')
 def extract_data(ws,channel,observable,name = None):
     '''
-    Extract data projection for a given channel and observable
+    Extract data projection for a given channel and observable. The observed data is split
+    into channels once per workspace and the channel histograms are cached.
 
     :param ws: a HistFactory workspace object
     :param channel: a channel name
@@ -121,42 +395,227 @@ def extract_data(ws,channel,observable,name = None):
 
     :return: the data histogram
     '''
-    data = ws.data(dataName())
-    reduced = data.reduce('channelCat == channelCat::{}'.format(channel))
+    datahist = _data_histogram(ws,channel,observable).Clone(name if name else 'data_{}'.format(channel))
+    datahist.SetDirectory(0)
+    return datahist
 
-    obsvar = ws.var(obsname(observable,channel))
+def extract_data_counts(ws,channel,observable):
+    '''
+    :param ws: a HistFactory workspace object
+    :param channel: a channel name
+    :param observable: the observable of the channel
+    :return: numpy array of the data counts per bin
+    '''
+    cache = workspace_cache(ws).setdefault('data_counts',{})
+    if (channel,observable) not in cache:
+        cache[(channel,observable)] = histogram_arrays(_data_histogram(ws,channel,observable))[0]
+    return cache[(channel,observable)]
 
-    varlist = ROOT.RooArgList()
-    varlist.add(obsvar)
+def iterate(collection):
+    '''
+    :param collection: a RooFit collection (e.g. RooArgSet, RooArgList)
+    :return: generator over the elements of the collection
+    '''
+    it = collection.createIterator()
+    v = it.Next()
+    while v:
+        yield v
+        v = it.Next()
 
-    datahist = obsvar.createHistogram(name if name else 'data_{}'.format(channel))
-    datahist = reduced.fillHistogram(datahist,varlist)
-    datahist.Sumw2(0)
-    return datahist
+def _shapesys_gamma_vars(ws,sysname,constraint_type):
+    cache = workspace_cache(ws).setdefault('shapesys_gammas',{})
+    if (sysname,constraint_type) in cache:
+        return cache[(sysname,constraint_type)]
+
+    prefix = 'gamma_{}_bin_'.format(sysname)
+    gammas = {}
+    for v in iterate(ws.allVars()):
+        name = v.GetName()
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            gammas[int(name[len(prefix):])] = v
+
+    varnames = shapeGaussVarNames if constraint_type == 'Gaussian' else shapePoissonVarNames
+    entries = []
+    for binnr in sorted(gammas):
+        gamma_name, width_name = varnames(sysname,binnr)
+        # the Gaussian widths are RooConstVars, which are neither in allVars nor in allFunctions
+        width = ws.obj(width_name)
+        if not width:
+            raise ValueError('no {} constraint width {} found for {}'.format(constraint_type,width_name,gamma_name))
+        entries += [(gamma_name,gammas[binnr],width)]
+    cache[(sysname,constraint_type)] = entries
+    return entries
+
+def shapesys_gammas(ws,sysname,constraint_type):
+    '''
+    collect the per-bin gamma parameters of a ShapeSys. The gammas are looked up in a single
+    pass over the workspace parameters and their constraint widths by name. The lookup is
+    cached per workspace, the values are read on every call.
+
+    :param ws: a HistFactory workspace object
+    :param sysname: the name of the ShapeSys
+    :param constraint_type: 'Gaussian' or 'Poisson'
+    :return: tuple of (gamma names, numpy array of values, numpy array of 1 sigma widths), ordered by bin
+    '''
+    if constraint_type not in ['Gaussian','Poisson']:
+        raise ValueError('unsupported ShapeSys constraint type {}'.format(constraint_type))
+
+    entries = _shapesys_gamma_vars(ws,sysname,constraint_type)
+    names  = [name for name,gamma,width in entries]
+    values = np.array([gamma.getVal() for name,gamma,width in entries],dtype = float)
+    widths = np.array([width.getVal() for name,gamma,width in entries],dtype = float)
+    if constraint_type == 'Poisson':
+        # the width var is tau, the relative uncertainty is 1/sqrt(tau)
+        widths = 1./np.sqrt(widths)
+    return names, values, widths
 
 def get_shapesys_pars(ws,observable,sysname,constraint_type):
-    allpars = pardict_up, pardict_nom, pardict_dn = {}, {}, {}
-    for binnr in range(observable.getBinning().numBins()):
-        gamma_name = 'gamma_{}_bin_{}'.format(sysname,binnr)
+    '''
+    +1, 0, -1 sigma parameter sets of a ShapeSys. All bins are shifted together, which
+    is equivalent to shifting them one by one as each gamma only acts on its own bin.
+
+    :return: list of up, nominal and down parameter dictionaries
+    '''
+    names, values, sigmas = shapesys_gammas(ws,sysname,constraint_type)
+    if observable:
+        nbins = observable.getBinning().numBins()
+        names = [n for n in names if int(n.split('_')[-1]) < nbins]
+        values, sigmas = values[:len(names)], sigmas[:len(names)]
+    return [dict(zip(names,(values+sign*sigmas).tolist())) for sign in [1,0,-1]]
+
+def fit_covariance(fitresult):
+    '''
+    :param fitresult: a RooFitResult
+    :return: tuple of (names, numpy array of fitted values, numpy covariance matrix) of the floating parameters
+    '''
+    pars = list(iterate(fitresult.floatParsFinal()))
+    names = [p.GetName() for p in pars]
+    values = np.array([p.getVal() for p in pars],dtype = float)
+    n = len(names)
+    cov = fitresult.covarianceMatrix()
+    matrix = _read_buffer(cov.GetMatrixArray(),'f8',n*n) if n else np.zeros(0)
+    if matrix is None:
+        matrix = np.array([cov(i,j) for i in range(n) for j in range(n)],dtype = float)
+    return names, values, matrix.reshape(n,n)
+
+def _fitted_values(ws,fitresult,names):
+    fitted = fitresult.floatParsFinal()
+    values, errors = [], []
+    for name in names:
+        par = fitted.find(name)
+        if par:
+            values.append(par.getVal())
+            errors.append(par.getError())
+        else:
+            values.append(ws.var(name).getVal())
+            errors.append(0.0)
+    return np.array(values,dtype = float), np.array(errors,dtype = float)
+
+def getsys_pars_from_fit(sysname,systype,fitresult,**kwargs):
+    '''
+    post-fit +1, 0, -1 sigma parameter sets of a systematic, i.e. the fitted values shifted by
+    their fitted errors. Parameters that were not floating in the fit keep their workspace value.
+
+    :param sysname: the name of the systematic
+    :param systype: OverallSys, HistoSys, ShapeSys or Lumi
+    :param fitresult: a RooFitResult
+    :return: list of up, nominal and down parameter dictionaries
+    '''
+    workspace = kwargs['workspace']
+    if systype in ['OverallSys','HistoSys']:
+        names = ['alpha_{}'.format(sysname)]
+    elif systype in ['ShapeSys']:
+        names = get_shapesys_pars(workspace,kwargs['observable'],sysname,kwargs['constraint_type'])[1].keys()
+    elif systype in ['Lumi']:
+        names = ['Lumi']
+    else:
+        raise NotImplementedError
+    values, errors = _fitted_values(workspace,fitresult,names)
+    return [dict(zip(names,(values+sign*errors).tolist())) for sign in [1,0,-1]]
 
-        mean_val,sigma_val = 0,0
-        if constraint_type == 'Gaussian':
-            gamma_name, gamma_sigma_name = shapeGaussVarNames(sysname,binnr)
-            sigma_val = ws.obj(gamma_sigma_name).getVal()
-            mean_val = ws.var(gamma_name).getVal()
+@contextlib.contextmanager
+def fit_point(ws,fitresult):
+    '''
+    context manager setting the floating parameters of a workspace to their fitted values,
+    the previous values are restored on exit
 
-        if constraint_type == 'Poisson':
-            gamma_name, gamma_tau_name = shapePoissonVarNames(sysname,binnr)
-            mean_val = ws.var(gamma_name).getVal()
-            sigma_val = 1./math.sqrt((ws.function(gamma_tau_name).getVal()))
+    :param ws: a HistFactory workspace object
+    :param fitresult: a RooFitResult
+    '''
+    previous = []
+    for par in iterate(fitresult.floatParsFinal()):
+        var = ws.var(par.GetName())
+        if var:
+            previous += [(var,var.getVal())]
+            var.setVal(par.getVal())
+    try:
+        yield
+    finally:
+        for var,value in previous:
+            var.setVal(value)
+
+@profiling.timed('postfit_variations')
+def postfit_variations(ws,channel,observable,components,fitresult,nsamples = None,seed = 1234):
+    '''
+    post-fit 1 sigma band of one or more (summed) model components, propagating the fit
+    covariance either linearly through a Jacobian obtained from one batch of single
+    parameter shifts or, if nsamples is given, by evaluating a batch of correlated parameter
+    samples and taking the per-bin 68% quantiles.
 
-        pardict_up.update(**{gamma_name:mean_val+sigma_val})
-        pardict_nom.update(**{gamma_name:mean_val})
-        pardict_dn.update(**{gamma_name:mean_val-sigma_val})
-    return allpars
+    :param ws: a HistFactory workspace object
+    :param channel: a channel name
+    :param observable: an observable name
+    :param components: a component name (None for the full pdf) or a list of component names
+    :param fitresult: a RooFitResult
+    :param nsamples: number of parameter samples (None for linear propagation)
+    :param seed: random seed for the parameter samples
+    :return: tuple of nominal, up and down histograms
+    '''
+    from . import diskcache
+    if not isinstance(components,(list,tuple)):
+        components = [components]
+
+    names, values, cov = fit_covariance(fitresult)
+    variables = [ws.var(name) for name in names]
+    low  = np.array([v.getMin() for v in variables],dtype = float)
+    high = np.array([v.getMax() for v in variables],dtype = float)
+
+    if nsamples:
+        samples = np.random.RandomState(seed).multivariate_normal(values,cov,nsamples)
+        samples = np.clip(samples,low,high)
+        parsets = [dict(zip(names,sample.tolist())) for sample in samples]
+    else:
+        steps = np.sqrt(np.clip(np.diag(cov),0,None))
+        # setVal clamps to the parameter range: step downwards where the upward step leaves it and
+        # use the shift that is actually applied for the derivative
+        steps = np.where(values+steps > high,-steps,steps)
+        steps = np.clip(values+steps,low,high) - values
+        shifted = [i for i,step in enumerate(steps) if step != 0]
+        parsets = [{names[i]:values[i]+steps[i]} for i in shifted]
+
+    with fit_point(ws,fitresult):
+        template = extract(ws,channel,observable,components[0])
+        nominal, variations = 0, 0
+        for component in components:
+            nom, var = extract_variations(ws,channel,observable,component,parsets,reference_snapshot = None,as_arrays = True)
+            nominal = nominal + nom
+            variations = variations + np.array(var).reshape(len(parsets),len(nom))
+
+    if nsamples:
+        down, up = np.percentile(variations,[15.865525393145707,84.13447460685429],axis = 0)
+    elif parsets:
+        jacobian = (variations - nominal) / steps[shifted][:,None]
+        subcov = cov[np.ix_(shifted,shifted)]
+        sigma = np.sqrt(np.einsum('ib,ij,jb->b',jacobian,subcov,jacobian))
+        down, up = nominal - sigma, nominal + sigma
+    else:
+        down, up = nominal, nominal
 
-def getsys_pars_from_fit(sysname,systype):
-    raise NotImplementedError
+    edges = histogram_edges(template)
+    zeros = np.zeros(len(edges)-1)
+    name = template.GetName()
+    return tuple(diskcache.to_root('{}_postfit_{}'.format(name,kind),edges,contents,zeros)
+                 for kind,contents in [('nominal',nominal),('up',up),('down',down)])
 
 def getsys_pars(sysname,systype,**kwargs):
     if systype in ['OverallSys','HistoSys']:
@@ -168,25 +627,115 @@ def getsys_pars(sysname,systype,**kwargs):
         constraint_type = kwargs['constraint_type']
         assert constraint_type
         assert observable
-        raise NotImplementedError
+        return get_shapesys_pars(workspace,observable,sysname,constraint_type)
     if systype in ['Lumi']:
         workspace      = kwargs['workspace']
         return [{'Lumi':v} for v in getParFromConstraint(workspace,'lumiConstraint','Lumi')]
 
-def getParFromConstraint(ws,constraintname,var):
-    # import scipy.stats
-    # pvals = [scipy.stats.norm.cdf(x) for x in [1,0,-1]]
-    # no need for a scipy dependence for just three numbers
-    # for +1,0,-1 sigma pvalues
-    pvals = [0.84134474606854293, 0.5, 0.15865525393145707]
-
-    varobj = ws.var(var)
+# import scipy.stats
+# pvals = [scipy.stats.norm.cdf(x) for x in [1,0,-1]]
+# no need for a scipy dependence for just three numbers
+# for +1,0,-1 sigma pvalues
+sigma_pvals = [0.84134474606854293, 0.5, 0.15865525393145707]
+
+def _servers(arg):
+    if hasattr(arg,'servers'):
+        return list(arg.servers())
+    servers = []
+    it = arg.serverIterator()
+    v = it.Next()
+    while v:
+        servers.append(v)
+        v = it.Next()
+    return servers
+
+def _clip(varobj,value):
+    return min(max(value,varobj.getMin()),varobj.getMax())
+
+def _gaussian_quantiles(varobj,servers,pvals):
+    x,mean,sigma = servers
+    if varobj.GetName() not in [x.GetName(),mean.GetName()]:
+        return None
+    center = mean if varobj.GetName() == x.GetName() else x
+    return [_clip(varobj,center.getVal()+ROOT.Math.normal_quantile(p,1.0)*sigma.getVal()) for p in pvals]
+
+def _lognormal_quantiles(varobj,servers,pvals):
+    x,m0,k = servers
+    if varobj.GetName() != x.GetName():
+        return None
+    return [_clip(varobj,m0.getVal()*k.getVal()**ROOT.Math.normal_quantile(p,1.0)) for p in pvals]
+
+def _gamma_quantiles(varobj,servers,pvals):
+    x,gamma,beta,mu = servers
+    if varobj.GetName() != x.GetName():
+        return None
+    return [_clip(varobj,mu.getVal()+ROOT.Math.gamma_quantile(p,gamma.getVal(),beta.getVal())) for p in pvals]
+
+def _poisson_quantiles(varobj,servers,pvals):
+    # HistFactory constrains a gamma with Poisson(n | tau * gamma). Seen as a function
+    # of gamma this is a Gamma(n+1, 1/tau) density, as long as the mean is linear in gamma
+    n,mean = servers
+    if not mean.dependsOn(varobj) or not varobj.getVal():
+        return None
+    value = varobj.getVal()
+    tau = mean.getVal()/value
+    varobj.setVal(2*value)
+    linear = abs(mean.getVal() - 2*tau*value) <= 1e-9*abs(2*tau*value)
+    varobj.setVal(value)
+    if not linear or tau <= 0:
+        return None
+    return [_clip(varobj,ROOT.Math.gamma_quantile(p,n.getVal()+1,1./tau)) for p in pvals]
+
+_analytic_quantiles = {
+    'RooGaussian': (3,_gaussian_quantiles),
+    'RooLognormal': (3,_lognormal_quantiles),
+    'RooGamma': (4,_gamma_quantiles),
+    'RooPoisson': (2,_poisson_quantiles),
+}
+
+def _numerical_quantiles(constraint,varobj,pvals):
     argset = ROOT.RooArgSet()
     argset.add(varobj)
-    constraint = ws.pdf(constraintname)
     cdf = constraint.createCdf(argset)
+    return [cdf.findRoot(varobj,varobj.getMin(),varobj.getMax(),pval) for pval in pvals]
 
-    x = up,nom,dn = [cdf.findRoot(varobj,varobj.getMin(),varobj.getMax(),pval) for pval in pvals]
+def constraint_quantiles(ws,constraintname,var,pvals = sigma_pvals):
+    '''
+    quantiles of a constraint term, seen as a density in one of its parameters.
+    Closed forms are used for the constraint types emitted by HistFactory (Gaussian,
+    LogNormal, Gamma and Poisson), other cases fall back to numerical root finding
+    on the CDF. Results are memoized per workspace, keyed on the values of all
+    parameters of the constraint.
 
-    return x
+    :param ws: a HistFactory workspace object
+    :param constraintname: name of the constraint pdf
+    :param var: name of the constrained parameter
+    :param pvals: list of cumulative probabilities
+    :return: list of parameter values, one per p-value
+    '''
+    varobj = ws.var(var)
+    constraint = ws.pdf(constraintname)
+
+    state = [(v.GetName(),v.getVal()) for v in iterate(constraint.getVariables()) if v.GetName() != var]
+    key = (constraintname,var,tuple(pvals),varobj.getMin(),varobj.getMax(),tuple(sorted(state)))
+
+    cache = workspace_cache(ws).setdefault('constraint_quantiles',{})
+    if key in cache:
+        profiling.count('constraint_quantile_hits')
+        return list(cache[key])
+
+    quantiles = None
+    nservers,analytic = _analytic_quantiles.get(constraint.ClassName(),(None,None))
+    servers = _servers(constraint) if analytic else []
+    if analytic and len(servers) == nservers:
+        quantiles = analytic(varobj,servers,pvals)
+    if quantiles is None:
+        log.debug('no closed form for %s in %s, using numerical quantiles',var,constraintname)
+        profiling.count('numerical_quantiles')
+        with profiling.span('numerical_quantiles'):
+            quantiles = _numerical_quantiles(constraint,varobj,pvals)
+    cache[key] = quantiles
+    return list(quantiles)
 
+def getParFromConstraint(ws,constraintname,var):
+    return constraint_quantiles(ws,constraintname,var)
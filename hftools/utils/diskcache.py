@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+from . import iterate
+from ..lazy import lazy_import
+np = lazy_import('numpy')
+ROOT = lazy_import('ROOT')
+
+import logging
+log = logging.getLogger(__name__)
+
+def file_hash(filename,chunksize = 1 << 20):
+    '''
+    :param filename: path to a file
+    :return: sha1 hex digest of the file content
+    '''
+    digest = hashlib.sha1()
+    with open(filename,'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize),b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parameter_values(parameters):
+    '''
+    :param parameters: a RooFit collection of variables (e.g. the parameters of a function)
+    :return: sorted list of (name,value) pairs of the variables
+    '''
+    return sorted((v.GetName(),v.getVal()) for v in iterate(parameters))
+
+def parameter_hash(values):
+    '''
+    canonical hash of a parameter point, independent of ordering and of float formatting
+
+    :param values: list of (name,value) pairs
+    :return: hex digest
+    '''
+    canonical = json.dumps([[name,float(value).hex()] for name,value in sorted(values)],separators = (',',':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+class HistogramCache(object):
+    '''
+    on-disk cache of extracted histograms stored as .npz files of bin edges, contents and errors.
+    Entries are keyed by the workspace file content, workspace name, channel, observable, component
+    and parameter point. The least recently used entries are evicted once the cache grows beyond max_bytes.
+    '''
+    def __init__(self,directory,workspace_file,max_bytes = 512 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workspace_hash = file_hash(workspace_file)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self,workspace,channel,observable,component,parhash):
+        fields = [self.workspace_hash,workspace,channel,observable,component or '__total__',parhash]
+        return hashlib.sha1('\0'.join(fields).encode('utf-8')).hexdigest()
+
+    def _path(self,key):
+        return os.path.join(self.directory,'{}.npz'.format(key))
+
+    def load(self,key):
+        '''
+        :param key: an entry key
+        :return: tuple of edges, contents and errors arrays or None if not cached
+        '''
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as entry:
+                arrays = entry['edges'],entry['contents'],entry['errors']
+        except (IOError,ValueError,KeyError):
+            log.warning('dropping unreadable cache entry %s',path)
+            os.remove(path)
+            return None
+        os.utime(path,None)
+        return arrays
+
+    def store(self,key,edges,contents,errors):
+        path = self._path(key)
+        tmppath = '{}.{}.tmp'.format(path,os.getpid())
+        with open(tmppath,'wb') as f:
+            np.savez(f,edges = edges,contents = contents,errors = errors)
+        os.rename(tmppath,path)
+        self.evict()
+
+    def evict(self):
+        '''
+        remove least recently used entries until the cache fits into max_bytes
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory,name)
+            stat = os.stat(path)
+            entries += [(stat.st_mtime,stat.st_size,path)]
+        total = sum(size for _,size,_ in entries)
+        for _,size,path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.directory,name))
+
+def to_root(name,edges,contents,errors):
+    '''
+    rebuild a ROOT histogram from cached arrays
+
+    :return: a TH1D object
+    '''
+    histo = ROOT.TH1D(name,name,len(edges)-1,np.asarray(edges,dtype = float))
+    histo.SetDirectory(0)
+    histo.Sumw2()
+    cells = np.zeros(len(edges)+1,dtype = float)
+    cells[1:-1] = contents
+    histo.SetContent(cells)
+    cells[1:-1] = errors
+    histo.SetError(cells)
+    return histo
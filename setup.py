@@ -13,6 +13,9 @@ setup(
         'numpy',
         'brewer2mpl',
     ],
+    extras_require = {
+        'matplotlib': ['matplotlib'],
+    },
     entry_points = {
         'console_scripts': [
             'hfquickplot = hftools.plotting.quickplot_cli:toplevel',
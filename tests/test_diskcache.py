@@ -0,0 +1,86 @@
+import os
+import numpy as np
+from hftools.utils.diskcache import HistogramCache, parameter_hash, parameter_values
+
+class FakeVar(object):
+    def __init__(self,name,value):
+        self.name = name
+        self.value = value
+
+    def GetName(self):
+        return self.name
+
+    def getVal(self):
+        return self.value
+
+class FakeCollection(object):
+    def __init__(self,variables):
+        self.variables = variables
+
+    def createIterator(self):
+        remaining = iter(self.variables + [None])
+        class Iterator(object):
+            def Next(self):
+                return next(remaining)
+        return Iterator()
+
+def _workspace_file(tmpdir,content = 'workspace'):
+    path = tmpdir.join('ws.root')
+    path.write(content)
+    return str(path)
+
+def test_parameter_hash():
+    assert parameter_hash([('a',1.0),('b',2.0)]) == parameter_hash([('b',2.0),('a',1)])
+    assert parameter_hash([('a',1.0),('b',2.0)]) != parameter_hash([('a',1.0),('b',2.0+1e-12)])
+
+def test_parameter_values():
+    values = parameter_values(FakeCollection([FakeVar('mu',1.5),FakeVar('alpha',0.0)]))
+    assert values == [('alpha',0.0),('mu',1.5)]
+
+def test_keys(tmpdir):
+    cache = HistogramCache(str(tmpdir.join('cache')),_workspace_file(tmpdir))
+    parhash = parameter_hash([('mu',1.0)])
+    key = cache.key('combined','SR','x','signal',parhash)
+    assert key == cache.key('combined','SR','x','signal',parhash)
+    others = [cache.key('other','SR','x','signal',parhash),
+              cache.key('combined','CR','x','signal',parhash),
+              cache.key('combined','SR','x',None,parhash),
+              cache.key('combined','SR','x','signal',parameter_hash([('mu',2.0)]))]
+    assert len(set(others + [key])) == 5
+
+def test_changed_workspace_file_invalidates(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    parhash = parameter_hash([])
+    before = HistogramCache(directory,_workspace_file(tmpdir,'old')).key('ws','SR','x',None,parhash)
+    after = HistogramCache(directory,_workspace_file(tmpdir,'new')).key('ws','SR','x',None,parhash)
+    assert before != after
+
+def test_store_and_load(tmpdir):
+    cache = HistogramCache(str(tmpdir.join('cache')),_workspace_file(tmpdir))
+    assert cache.load('missing') is None
+    edges, contents, errors = np.linspace(0,1,4), np.array([1.0,2.0,3.0]), np.array([0.5,0.5,0.5])
+    cache.store('entry',edges,contents,errors)
+    loaded = cache.load('entry')
+    for expected,found in zip([edges,contents,errors],loaded):
+        assert np.array_equal(expected,found)
+    cache.clear()
+    assert cache.load('entry') is None
+
+def test_unreadable_entry_is_dropped(tmpdir):
+    cache = HistogramCache(str(tmpdir.join('cache')),_workspace_file(tmpdir))
+    path = os.path.join(cache.directory,'broken.npz')
+    with open(path,'w') as f:
+        f.write('not a numpy file')
+    assert cache.load('broken') is None
+    assert not os.path.exists(path)
+
+def test_eviction(tmpdir):
+    cache = HistogramCache(str(tmpdir.join('cache')),_workspace_file(tmpdir))
+    arrays = np.zeros(2), np.zeros(1), np.zeros(1)
+    cache.store('first',*arrays)
+    cache.max_bytes = 2*os.path.getsize(os.path.join(cache.directory,'first.npz'))
+    os.utime(os.path.join(cache.directory,'first.npz'),(0,0))
+    cache.store('second',*arrays)
+    cache.store('third',*arrays)
+    assert cache.load('first') is None
+    assert cache.load('second') is not None and cache.load('third') is not None
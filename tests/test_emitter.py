@@ -0,0 +1,40 @@
+import yaml
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from hftools.hepdata.rootcnv.emitter import dump_table
+
+def _table():
+    return {
+        'name': 'Channel SR',
+        'independent_variables': [
+            {'header': {'name': 'x', 'units': 'GeV'}, 'values': [{'low': 0.0, 'high': 1.5}, {'low': 1.5, 'high': 3.0}]}
+        ],
+        'dependent_variables': [
+            {'header': {'name': 'Data'}, 'values': [{'value': 10.0}, {'value': 7.0}]},
+            {'header': {'name': 'signal'}, 'qualifiers': [{'name': 'SQRT(S)', 'value': 13000}],
+             'values': [{'value': 1.25, 'errors': [{'asymerror': {'minus': -0.5, 'plus': 0.25}, 'label': 'syst'}]},
+                        {'value': 2.0, 'errors': [{'symerror': 0.1, 'label': 'stat'}]}]},
+            {'header': {'name': 'empty'}, 'values': []},
+        ],
+    }
+
+def _dump(table):
+    stream = StringIO()
+    dump_table(table,stream)
+    return stream.getvalue()
+
+def test_dump_table_matches_safe_dump():
+    assert _dump(_table()) == yaml.safe_dump(_table(),default_flow_style = False)
+
+def test_dump_table_consumes_iterables():
+    lazy = _table()
+    for variable in lazy['dependent_variables'] + lazy['independent_variables']:
+        variable['values'] = iter(variable['values'])
+    lazy['dependent_variables'] = iter(lazy['dependent_variables'])
+    assert _dump(lazy) == yaml.safe_dump(_table(),default_flow_style = False)
+
+def test_dump_table_without_variables():
+    table = {'name': 'empty', 'dependent_variables': [], 'independent_variables': []}
+    assert _dump(table) == yaml.safe_dump(table,default_flow_style = False)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from hftools.hepdata.rootcnv import formatters
+from hftools.hepdata import nominal_with_all_systs
+
+def _per_bin(columns,i):
+    return {name:{key:float(values[i]) for key,values in column.items()} for name,column in columns.items()}
+
+def _compare(legacy,columns,nbins,**kwargs):
+    columnar = formatters.as_columnar(legacy)
+    assert columnar is not None
+    assert columnar(columns,**kwargs) == [legacy(_per_bin(columns,i),**kwargs) for i in range(nbins)]
+
+def _column(values,plus = None,minus = None):
+    values = np.array(values,dtype = float)
+    zeros = np.zeros(len(values))
+    return {'value': values,
+            'error_plus': np.array(plus,dtype = float) if plus is not None else zeros,
+            'error_minus': np.array(minus,dtype = float) if minus is not None else zeros}
+
+@pytest.mark.parametrize('error_config',[None,'asymmetric','symmetric'])
+def test_standard_format(error_config):
+    columns = {'histo': _column([1.0,2.5,0.0],[0.5,0.25,1.0],[0.25,0.5,0.0])}
+    _compare(formatters.standard_format,columns,3,error_config = error_config,label = 'stat')
+
+def test_nominal_with_variations():
+    columns = {'nominal': _column([1.0,2.0]), 'up': _column([1.5,2.25]), 'down': _column([0.75,1.0])}
+    _compare(formatters.nominal_with_variations_formatter,columns,2,label = 'syst')
+
+@pytest.mark.parametrize('style',[None,'central_value'])
+def test_bin_format(style):
+    columns = {'low': np.array([0.0,1.5,3.0]), 'width': np.array([1.5,1.5,2.0])}
+    columnar = formatters.as_columnar(formatters.bin_format)
+    legacy = [formatters.bin_format({'low': float(low), 'width': float(width)},style = style)
+              for low,width in zip(columns['low'],columns['width'])]
+    assert columnar(columns,style = style) == legacy
+
+def test_nominal_with_all_systs():
+    columns = {'nominal_SR': _column([1.0,2.0]),
+               'systhist_lumi_up': _column([1.1,2.2]), 'systhist_lumi_down': _column([0.9,1.8]),
+               'systhist_jes_up': _column([1.5,2.5]), 'systhist_jes_down': _column([0.5,1.5])}
+    _compare(nominal_with_all_systs,columns,2)
+
+def test_lookup():
+    assert formatters.lookup('standard_format') is formatters.standard_format
+    with pytest.raises(KeyError):
+        formatters.lookup('no_such_formatter')
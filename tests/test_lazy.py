@@ -0,0 +1,18 @@
+import sys
+from hftools.lazy import lazy_import, on_import
+
+def test_lazy_import_defers_loading():
+    sys.modules.pop('colorsys',None)
+    colorsys = lazy_import('colorsys')
+    assert 'colorsys' not in sys.modules
+    assert colorsys.rgb_to_hsv(1,0,0) == (0,1,1)
+    assert 'colorsys' in sys.modules
+
+def test_import_hooks():
+    sys.modules.pop('wave',None)
+    calls = []
+    on_import('wave',calls.append)
+    wave = lazy_import('wave')
+    assert not calls
+    wave.open
+    assert calls and calls[0].__name__ == 'wave'
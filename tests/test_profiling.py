@@ -0,0 +1,48 @@
+import time
+import pytest
+from hftools import profiling
+
+@pytest.fixture
+def profile():
+    profiling.enable()
+    profiling.reset()
+    yield
+    profiling.disable()
+    profiling.reset()
+
+def test_disabled_is_noop():
+    profiling.disable()
+    profiling.reset()
+    with profiling.span('stage'):
+        profiling.count('things')
+    assert profiling.report()['spans'] == {}
+    assert profiling.report()['counters'] == {}
+
+def test_nested_spans(profile):
+    with profiling.span('outer'):
+        with profiling.span('inner'):
+            time.sleep(0.02)
+        profiling.count('things',3)
+    spans = profiling.report()['spans']
+    assert spans['outer']['calls'] == spans['inner']['calls'] == 1
+    assert spans['outer']['total'] >= spans['inner']['total'] >= 0.02
+    assert spans['outer']['self'] < spans['inner']['total']
+    assert profiling.report()['counters'] == {'things':3}
+
+def test_timed(profile):
+    @profiling.timed('work')
+    def work(x):
+        return x+1
+    assert work(1) == 2 and work(2) == 3
+    assert profiling.report()['spans']['work']['calls'] == 2
+
+def test_merge(profile):
+    with profiling.span('stage'):
+        profiling.count('things')
+    other = profiling.report()
+    profiling.merge(other)
+    merged = profiling.report()
+    assert merged['spans']['stage']['calls'] == 2
+    assert merged['spans']['stage']['total'] == pytest.approx(2*other['spans']['stage']['total'])
+    assert merged['spans']['stage']['max'] == other['spans']['stage']['max']
+    assert merged['counters'] == {'things':2}
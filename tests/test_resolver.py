@@ -0,0 +1,104 @@
+import pytest
+from hftools.hepdata.rootcnv import resolver
+from hftools.hepdata.rootcnv.resolver import ObjectResolver, group_by_file
+
+class FakeObject(object):
+    def __init__(self,name):
+        self.name = name
+
+    def SetDirectory(self,directory):
+        pass
+
+class FakeKey(object):
+    def __init__(self,seek):
+        self.seek = seek
+
+    def GetSeekKey(self):
+        return self.seek
+
+class FakeFile(object):
+    def __init__(self,filename):
+        self.filename = filename
+        self.closed = False
+
+    def IsZombie(self):
+        return False
+
+    def Get(self,path):
+        return FakeObject('{}:{}'.format(self.filename,path)) if not path.startswith('missing') else None
+
+    def GetKey(self,name):
+        return FakeKey(len(name))
+
+    def GetDirectory(self,name):
+        return self
+
+    def Close(self):
+        self.closed = True
+
+class FakeROOT(object):
+    def __init__(self):
+        self.opened = []
+        fake = self
+        class TFile(object):
+            @staticmethod
+            def Open(filename):
+                rootfile = FakeFile(filename)
+                fake.opened += [rootfile]
+                return rootfile
+        self.TFile = TFile
+
+    def SetOwnership(self,obj,owned):
+        pass
+
+@pytest.fixture
+def fake_root(monkeypatch):
+    fake = FakeROOT()
+    monkeypatch.setattr(resolver,'ROOT',fake)
+    return fake
+
+def test_group_by_file():
+    grouped = group_by_file(['b.root:h2','a.root:dir/h1','b.root:h1','b.root:h2'])
+    assert list(grouped.items()) == [('b.root',['h1','h2']),('a.root',['dir/h1'])]
+
+def test_planned_objects_are_read_in_one_pass(fake_root):
+    objects = ObjectResolver()
+    objects.plan(['a.root:h1','a.root:h2','b.root:h3'])
+    assert objects.get('a.root:h1').name == 'a.root:h1'
+    assert objects.get('a.root:h2').name == 'a.root:h2'
+    assert objects.stats() == {'hits':1,'misses':1,'reads':2,'file_opens':1,'evictions':0}
+
+def test_release_after_last_use(fake_root):
+    objects = ObjectResolver()
+    objects.plan(['a.root:h1','a.root:h2','a.root:h1'])
+    objects.get('a.root:h1')
+    objects.release('a.root:h1')
+    assert 'a.root:h1' in objects.objects
+    objects.get('a.root:h1')
+    objects.release('a.root:h1')
+    assert 'a.root:h1' not in objects.objects
+    assert not fake_root.opened[0].closed
+    objects.get('a.root:h2')
+    objects.release('a.root:h2')
+    assert not objects.objects
+    assert fake_root.opened[0].closed
+
+def test_lru_eviction(fake_root):
+    objects = ObjectResolver(max_objects = 2)
+    for identifier in ['a.root:h1','a.root:h2','a.root:h1','a.root:h3']:
+        objects.get(identifier)
+    assert list(objects.objects) == ['a.root:h1','a.root:h3']
+    assert objects.stats()['evictions'] == 1
+
+def test_open_file_limit(fake_root):
+    objects = ObjectResolver(max_open_files = 1)
+    objects.plan(['a.root:h1','b.root:h1'])
+    objects.get('a.root:h1')
+    objects.get('b.root:h1')
+    assert fake_root.opened[0].closed and not fake_root.opened[1].closed
+    objects.close()
+    assert fake_root.opened[1].closed
+
+def test_missing_object(fake_root):
+    with pytest.raises(RuntimeError):
+        ObjectResolver().get('a.root:missing')
@@ -0,0 +1,14 @@
+from hftools.utils import splitComponentFunc, isComponentFunc
+
+def test_split_component_function():
+    channels = ['SR','SR_high','CR_top']
+    assert splitComponentFunc('L_x_ttbar_SR_overallSyst_x_Exp',channels) == ('ttbar','SR')
+    assert splitComponentFunc('L_x_ttbar_SR_high_overallSyst_x_StatUncert',channels) == ('ttbar','SR_high')
+    assert splitComponentFunc('L_x_single_top_CR_top_overallSyst_x_HistSyst',channels) == ('single_top','CR_top')
+    assert splitComponentFunc('L_x_ttbar_VR_overallSyst_x_Exp',channels) is None
+    assert splitComponentFunc('ttbar_SR_overallSyst_x_Exp',channels) is None
+
+def test_is_component_function():
+    assert isComponentFunc('SR','L_x_ttbar_SR_overallSyst_x_Exp')
+    assert isComponentFunc('SR','L_x_ttbar_SR_overallSyst_x_Exp','ttbar')
+    assert not isComponentFunc('SR','L_x_ttbar_SR_high_overallSyst_x_Exp')
@@ -0,0 +1,47 @@
+import os
+import pytest
+from hftools import processes
+from hftools.fitting import workers
+
+def test_read_records_skips_truncated_record(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.yaml'))
+    assert workers.read_records(checkpoint) == []
+    records = [{'parameter':'alpha_a','poi_up':1.25}, {'parameter':'alpha_b','error':'failed'}]
+    for record in records:
+        workers.append_record(checkpoint,record)
+    with open(checkpoint,'a') as f:
+        f.write('---\nparameter: alpha_c\npoi_up: [1.0,')
+    assert workers.read_records(checkpoint) == records
+
+def test_read_records_skips_partial_scalar(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.yaml'))
+    workers.append_record(checkpoint,{'value':1.0})
+    with open(checkpoint,'a') as f:
+        f.write('---\nval')
+    assert workers.read_records(checkpoint) == [{'value':1.0}]
+
+def _square(x):
+    processes.emit({'task':x})
+    return x*x
+
+def _crash_on_three(x):
+    if x == 3:
+        os._exit(1)
+    return x*x
+
+@pytest.mark.parametrize('jobs',[1,2])
+def test_run(jobs):
+    results, records = {}, []
+    processes.run(_square,range(5),jobs,on_result = results.__setitem__,on_record = records.append)
+    assert results == {i:i*i for i in range(5)}
+    assert sorted(r['task'] for r in records) == list(range(5))
+
+def test_run_reports_dead_worker():
+    results, lost = {}, []
+    processes.run(_crash_on_three,range(6),2,on_result = results.__setitem__,on_lost = lost.append)
+    assert lost == [3]
+    assert results == {i:i*i for i in range(6) if i != 3}
+
+def test_run_raises_on_dead_worker():
+    with pytest.raises(RuntimeError):
+        processes.run(_crash_on_three,range(6),2)